@@ -0,0 +1,112 @@
+"""moto-backed stand-ins for the AWS services the app uses.
+
+    with stub_aws(bedrock_latency=2) as stubs:
+        ...  # save_img_s3_buffer, DynamoAdapter, recommendation_pipeline work offline
+        stubs.bedrock_calls
+
+S3 and DynamoDB are moto's in-memory mocks, with Config.BUCKET_NAME and
+Config.TABLE_NAME created up front. moto does not implement the Bedrock
+runtime, so Converse and ConverseStream are answered by a before-call hook on
+the shared bedrock-runtime client, with a canned JSON prompt answer after
+bedrock_latency seconds. Shared clients and DynamoDB writers are reset on
+entry and exit, so nothing created inside the stub talks to real AWS later.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from botocore.awsrequest import AWSResponse
+from moto import mock_aws
+from src.code import aws_clients
+from src.code.aws_clients import get_client
+from src.code.config import Config
+from src.code.dynamo_adapter import DynamoAdapter
+
+DEFAULT_ANSWER = json.dumps({
+    "Character prompt": "Pixel art of a cheerful cat mascot in a blue witch dress, running pose.",
+    "Obstacles prompt:": "Tall glowing crystal spires, stylized vector look, white background.",
+    "Background prompt:": "16-bit pixel art sky with floating islands and a flat grassy runway.",
+})
+
+
+class _EventStream:
+    # Just enough of botocore's EventStream for recommendation_pipeline_stream.
+    def __init__(self, events):
+        self._events = events
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def close(self):
+        pass
+
+
+class AwsStubs:
+    def __init__(self, bedrock_latency, bedrock_answer, stream_chunk):
+        self.bedrock_latency = bedrock_latency
+        self.bedrock_answer = bedrock_answer
+        self.stream_chunk = stream_chunk
+        self.bedrock_calls = 0
+        self._lock = threading.Lock()
+
+    def purge_s3(self, older_than):
+        """Delete stub objects older than older_than seconds; moto keeps every upload in memory."""
+        s3 = get_client("s3")
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=Config.BUCKET_NAME):
+            expired = [{"Key": item["Key"]} for item in page.get("Contents", []) if item["LastModified"] < cutoff]
+            if expired:
+                s3.delete_objects(Bucket=Config.BUCKET_NAME, Delete={"Objects": expired})
+
+    def _converse(self, model, params, **kwargs):
+        with self._lock:
+            self.bedrock_calls += 1
+        time.sleep(self.bedrock_latency)
+        http = AWSResponse(params["url"], 200, {}, None)
+        usage = {"inputTokens": 0, "outputTokens": 0, "totalTokens": 0}
+        if model.name == "ConverseStream":
+            answer = self.bedrock_answer
+            events = [{"messageStart": {"role": "assistant"}}] + [
+                {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": answer[start:start + self.stream_chunk]}}}
+                for start in range(0, len(answer), self.stream_chunk)
+            ] + [{"messageStop": {"stopReason": "end_turn"}}, {"metadata": {"usage": usage}}]
+            return http, {"stream": _EventStream(events)}
+        return http, {
+            "output": {"message": {"role": "assistant", "content": [{"text": self.bedrock_answer}]}},
+            "stopReason": "end_turn",
+            "usage": usage,
+        }
+
+
+def _reset_clients():
+    DynamoAdapter.close_writers()
+    aws_clients.reset()
+
+
+@contextmanager
+def stub_aws(bedrock_latency=0.0, bedrock_answer=DEFAULT_ANSWER, stream_chunk=16):
+    endpoint_url = Config.AWS_ENDPOINT_URL
+    # moto only intercepts requests to the real AWS endpoints.
+    Config.AWS_ENDPOINT_URL = None
+    _reset_clients()
+    try:
+        with mock_aws():
+            get_client("s3").create_bucket(Bucket=Config.BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": Config.REGION_NAME})
+            get_client("dynamodb").create_table(
+                TableName=Config.TABLE_NAME,
+                KeySchema=[{"AttributeName": "bucket_id", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "bucket_id", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+            stubs = AwsStubs(bedrock_latency, bedrock_answer, stream_chunk)
+            events = get_client("bedrock-runtime").meta.events
+            events.register("before-call.bedrock-runtime.Converse", stubs._converse)
+            events.register("before-call.bedrock-runtime.ConverseStream", stubs._converse)
+            try:
+                yield stubs
+            finally:
+                # Drain buffered registry writes while the mock is still active.
+                _reset_clients()
+    finally:
+        Config.AWS_ENDPOINT_URL = endpoint_url
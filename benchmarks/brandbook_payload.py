@@ -0,0 +1,57 @@
+"""Compare the whole-PDF and pre-processed brandbook paths of recommendation_pipeline.
+
+Usage (from the repository root):
+    python -m benchmarks.brandbook_payload path/to/brandbook.pdf [--bedrock]
+
+Without --bedrock only payload size and pre-processing time are reported.
+With --bedrock both paths are sent to Bedrock (cache bypassed) and the
+latency and generated prompts are printed side by side for review.
+"""
+import argparse
+import time
+from src.code import bedrock_pipeline
+from src.code.brandbook_preprocessing import payload_size
+
+
+def run_path(pdf_bytes, preprocess, call_bedrock):
+    start = time.perf_counter()
+    content = bedrock_pipeline.build_brandbook_content(pdf_bytes, preprocess)
+    build_seconds = time.perf_counter() - start
+    result = {"payload_bytes": payload_size(content), "build_seconds": build_seconds, "blocks": len(content)}
+    if call_bedrock:
+        start = time.perf_counter()
+        result["output"] = bedrock_pipeline.recommendation_pipeline(pdf_bytes, preprocess=preprocess, use_cache=False)
+        result["bedrock_seconds"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--bedrock", action="store_true", help="also call Bedrock for latency and output quality")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as file:
+        pdf_bytes = file.read()
+
+    results = {
+        "whole-pdf": run_path(pdf_bytes, False, args.bedrock),
+        "pre-processed": run_path(pdf_bytes, True, args.bedrock),
+    }
+    baseline = results["whole-pdf"]["payload_bytes"]
+    for name, result in results.items():
+        line = (f"{name:>14}: {result['payload_bytes'] / 1024:10.1f} KiB "
+                f"({result['payload_bytes'] / baseline:6.1%} of whole PDF), "
+                f"{result['blocks']} blocks, built in {result['build_seconds'] * 1000:.0f} ms")
+        if "bedrock_seconds" in result:
+            line += f", Bedrock {result['bedrock_seconds']:.2f} s"
+        print(line)
+    if args.bedrock:
+        for name, result in results.items():
+            print(f"\n--- {name} output ---")
+            for key, value in (result["output"] or {}).items():
+                print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""In-process stand-in for a ComfyUI server, for benchmarks and local runs without a GPU.
+
+Usage (from the repository root):
+    python -m benchmarks.fake_comfy --port 8188 --latency 2
+
+then point the app at it with COMFY_SERVERS=127.0.0.1:8188. Benchmarks start
+it in a background thread instead (start_fake_comfy()).
+
+It speaks the parts of the ComfyUI API the app uses: POST /prompt, GET and
+POST /queue, POST /interrupt, POST /upload/image and the /ws event stream.
+Prompts run one at a time, as on a real server: execution_start, an
+executing event per node, progress events while the sampler "runs", one
+8-byte-header binary PNG frame per batch item at every websocket output
+node (one if a batch-join node feeds it), then executing with node None. Rendering takes latency seconds plus
+per_image seconds per batch item. Images are random noise at the latent
+size, so they weigh about as much as real renders.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import struct
+import threading
+import uuid
+from aiohttp import WSCloseCode, web
+from PIL import Image
+from src.code.comfy_client import OUTPUT_NODE_CLASSES
+from src.code.workflow_compiler import LATENT_CLASSES, SAMPLER_CLASSES
+
+# Binary event type 1 (PREVIEW_IMAGE), format 2 (PNG), as sent by ComfyUI.
+FRAME_HEADER = struct.pack(">II", 1, 2)
+# Nodes that join a batch into one image (the obstacle workflow's sprite strip).
+BATCH_JOIN_CLASSES = ("easy joinImageBatch",)
+
+
+class FakeComfyServer:
+    def __init__(self, latency=1.0, per_image=0.0, steps=10):
+        self.latency = latency
+        self.per_image = per_image
+        self.steps = steps
+        self.pending = []
+        self.running = None
+        self.uploads = {}
+        self.prompts_completed = 0
+        self.prompts_interrupted = 0
+        self._queue = None
+        self._clients = {}
+        self._images = {}
+        self._task = None
+        self._interrupted = False
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/prompt", self._prompt)
+        app.router.add_get("/queue", self._get_queue)
+        app.router.add_post("/queue", self._post_queue)
+        app.router.add_post("/interrupt", self._interrupt)
+        app.router.add_post("/upload/image", self._upload)
+        app.router.add_get("/ws", self._ws)
+        app.on_startup.append(self._start_worker)
+        app.on_shutdown.append(self._close_clients)
+        app.on_cleanup.append(self._stop_worker)
+        return app
+
+    # --- HTTP ---
+    async def _prompt(self, request):
+        body = await request.json()
+        graph = body.get("prompt")
+        if not isinstance(graph, dict) or not graph:
+            return web.json_response({"error": "invalid prompt", "node_errors": {}}, status=400)
+        prompt_id = str(uuid.uuid4())
+        self.pending.append((prompt_id, body.get("client_id"), graph))
+        self._queue.put_nowait(None)
+        return web.json_response({"prompt_id": prompt_id, "number": len(self.pending), "node_errors": {}})
+
+    async def _get_queue(self, request):
+        running = [[0, self.running[0], self.running[2], {}, []]] if self.running else []
+        pending = [[number, prompt_id, graph, {}, []] for number, (prompt_id, _, graph) in enumerate(self.pending, 1)]
+        return web.json_response({"queue_running": running, "queue_pending": pending})
+
+    async def _post_queue(self, request):
+        body = await request.json()
+        if body.get("clear"):
+            self.pending.clear()
+        deleted = set(body.get("delete", []))
+        self.pending = [entry for entry in self.pending if entry[0] not in deleted]
+        return web.Response()
+
+    async def _interrupt(self, request):
+        body = await request.json() if request.can_read_body else {}
+        prompt_id = body.get("prompt_id")
+        if self.running and self._task and prompt_id in (None, self.running[0]):
+            self._interrupted = True
+            self._task.cancel()
+        return web.Response()
+
+    async def _upload(self, request):
+        fields = {}
+        async for part in (await request.multipart()):
+            if part.name == "image":
+                fields["filename"] = part.filename
+                fields["image"] = await part.read()
+            else:
+                fields[part.name] = await part.text()
+        subfolder = fields.get("subfolder", "")
+        self.uploads[f"{subfolder}/{fields['filename']}" if subfolder else fields["filename"]] = fields["image"]
+        return web.json_response({"name": fields["filename"], "subfolder": subfolder, "type": fields.get("type", "input")})
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        client_id = request.query.get("clientId")
+        self._clients[client_id] = ws
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            if self._clients.get(client_id) is ws:
+                del self._clients[client_id]
+        return ws
+
+    # --- Execution ---
+    async def _start_worker(self, app):
+        self._queue = asyncio.Queue()
+        app["worker"] = asyncio.create_task(self._worker())
+
+    async def _stop_worker(self, app):
+        app["worker"].cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await app["worker"]
+
+    async def _close_clients(self, app):
+        for ws in list(self._clients.values()):
+            await ws.close(code=WSCloseCode.GOING_AWAY)
+
+    async def _worker(self):
+        while True:
+            await self._queue.get()
+            if not self.pending:
+                # Deleted from the queue before it ran.
+                continue
+            self.running = self.pending.pop(0)
+            prompt_id, client_id, graph = self.running
+            self._interrupted = False
+            self._task = asyncio.create_task(self._execute(prompt_id, client_id, graph))
+            try:
+                await self._task
+                self.prompts_completed += 1
+            except asyncio.CancelledError:
+                if not self._interrupted:
+                    # The worker itself is being stopped.
+                    raise
+                self.prompts_interrupted += 1
+                await self._send(client_id, {"type": "execution_interrupted", "data": {"prompt_id": prompt_id}})
+            finally:
+                self.running = None
+                self._task = None
+
+    async def _execute(self, prompt_id, client_id, graph):
+        batch_size, width, height = 1, 512, 512
+        for node in graph.values():
+            if node.get("class_type") in LATENT_CLASSES:
+                batch_size = int(node["inputs"].get("batch_size", 1))
+                width = int(node["inputs"].get("width", width))
+                height = int(node["inputs"].get("height", height))
+        image = await asyncio.to_thread(self._image, width, height)
+        render_time = self.latency + self.per_image * batch_size
+        samplers = [node_id for node_id, node in graph.items() if node.get("class_type") in SAMPLER_CLASSES]
+        step_time = render_time / (max(len(samplers), 1) * self.steps)
+
+        await self._send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+        for node_id, node in graph.items():
+            await self._send(client_id, {"type": "executing", "data": {"node": node_id, "prompt_id": prompt_id}})
+            if node_id in samplers:
+                for step in range(1, self.steps + 1):
+                    await asyncio.sleep(step_time)
+                    await self._send(client_id, {
+                        "type": "progress", "data": {"value": step, "max": self.steps, "prompt_id": prompt_id, "node": node_id}
+                    })
+            elif node.get("class_type") in OUTPUT_NODE_CLASSES:
+                ws = self._clients.get(client_id)
+                for _ in range(1 if self._joins_batch(graph, node_id) else batch_size):
+                    if ws is not None:
+                        await ws.send_bytes(FRAME_HEADER + image)
+        if not samplers:
+            await asyncio.sleep(render_time)
+        await self._send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+    @staticmethod
+    def _joins_batch(graph, node_id):
+        # Walk the node's upstream links looking for a batch-join node.
+        seen = set()
+        pending = [node_id]
+        while pending:
+            node = graph.get(pending.pop())
+            if node is None:
+                continue
+            if node.get("class_type") in BATCH_JOIN_CLASSES:
+                return True
+            for value in node.get("inputs", {}).values():
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] not in seen:
+                    seen.add(value[0])
+                    pending.append(value[0])
+        return False
+
+    async def _send(self, client_id, message):
+        ws = self._clients.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_str(json.dumps(message))
+
+    def _image(self, width, height):
+        image = self._images.get((width, height))
+        if image is None:
+            buffer = io.BytesIO()
+            Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(buffer, format="PNG")
+            image = self._images[(width, height)] = buffer.getvalue()
+        return image
+
+
+class RunningServer:
+    """A FakeComfyServer served from a background thread; see start_fake_comfy()."""
+
+    def __init__(self, server, loop, runner, thread, address):
+        self.server = server
+        self.address = address
+        self._loop = loop
+        self._runner = runner
+        self._thread = thread
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def start_fake_comfy(host="127.0.0.1", port=0, **options):
+    """Serve a FakeComfyServer(**options) on host:port (0 picks a free port) from a daemon thread."""
+    server = FakeComfyServer(**options)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(server.app())
+
+    async def start():
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner.addresses[0][1]
+
+    thread = threading.Thread(target=loop.run_forever, name="fake-comfy", daemon=True)
+    thread.start()
+    bound_port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    return RunningServer(server, loop, runner, thread, f"{host}:{bound_port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per prompt")
+    parser.add_argument("--per-image", type=float, default=0.0, help="extra seconds per batch item")
+    parser.add_argument("--steps", type=int, default=10, help="progress events per sampler")
+    args = parser.parse_args()
+    server = FakeComfyServer(latency=args.latency, per_image=args.per_image, steps=args.steps)
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
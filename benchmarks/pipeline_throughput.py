@@ -0,0 +1,197 @@
+"""End-to-end throughput of the generation pipeline against local stand-ins.
+
+Usage (from the repository root):
+    python -m benchmarks.pipeline_throughput --concurrency 1,2,4,8 --requests 16 --servers 2 --latency 0.5
+
+Starts --servers fake ComfyUI servers (benchmarks/fake_comfy.py) and the moto
+AWS stubs (benchmarks/aws_stubs.py), then runs each scenario at every
+concurrency level:
+
+    generate  Workflow.generate_asset -> save_img_s3_buffer -> DynamoAdapter
+    tiles     decode a rendered background -> split_image_into_tiles -> save_img_s3_tiles
+
+and reports throughput, latency percentiles and the peak RSS seen during the
+level. Buffered registry writes are flushed before a level's clock stops.
+Nothing leaves the machine, so results measure the client side of the
+pipeline (scheduling, websocket frames, encoding, uploads) around a GPU of
+known speed; compare runs on the same machine only.
+"""
+import argparse
+import json
+import logging
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.aws_stubs import stub_aws
+from benchmarks.fake_comfy import start_fake_comfy
+from src.code.config import Config
+from src.code.dynamo_adapter import DynamoAdapter
+from src.code.generated_image import GeneratedImage
+from src.code.s3_adapter import save_img_s3_buffer, save_img_s3_tiles
+from src.code.telemetry import metrics
+from src.code.tiling import split_image_into_tiles
+from src.code.workflow import Workflow
+
+logger = logging.getLogger("benchmarks.pipeline_throughput")
+
+PROMPT = "Pixel art of a cheerful cat mascot in a blue witch dress, running pose."
+
+
+def current_rss():
+    """Resident set size in bytes (Linux /proc; peak RSS from getrusage elsewhere)."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRss:
+    """Samples RSS in a background thread while the block runs; .peak is the maximum seen."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+class Scenarios:
+    def __init__(self, asset_type, variants, split):
+        self.asset_type = asset_type
+        self.variants = variants
+        self.split = split
+        self.dyna = DynamoAdapter(logger, Config.TABLE_NAME, buffered=True)
+        self.background = None
+
+    def generate(self):
+        workflow = Workflow(logger=logger, deterministic=False)
+        for image in workflow.generate_asset(self.asset_type, PROMPT, self.variants):
+            s3_key = save_img_s3_buffer(self.asset_type, image.open())
+            self.dyna.save_chat_history_record(s3_key, PROMPT)
+
+    def tiles(self):
+        if self.background is None:
+            raise RuntimeError("no background rendered")
+        rows, cols = self.split
+        # A fresh GeneratedImage per run, so the PNG decode is measured like on the page.
+        image = GeneratedImage(self.background).pil
+        save_img_s3_tiles("background", split_image_into_tiles(image, rows, cols))
+
+    def prepare(self):
+        images = Workflow(logger=logger, deterministic=False).generate_asset("background", PROMPT)
+        self.background = images[0].tobytes()
+
+    def flush(self):
+        self.dyna.writer.flush()
+
+
+def run_level(operation, concurrency, requests, flush):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            operation()
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(requests):
+                executor.submit(timed)
+        flush()
+        wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency, "requests": requests, "errors": errors, "wall_seconds": wall,
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 0.5), "p90": percentile(latencies, 0.9), "p99": percentile(latencies, 0.99),
+        "peak_rss_mib": rss.peak / 1024 ** 2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="generate,tiles", help="comma-separated: generate, tiles")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="operations per level")
+    parser.add_argument("--servers", type=int, default=1, help="fake ComfyUI servers to balance over")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake render seconds per prompt")
+    parser.add_argument("--per-image", type=float, default=0.0, help="extra fake render seconds per batch item")
+    parser.add_argument("--asset-type", default="character", choices=sorted(Config.ASSET_WORKFLOWS))
+    parser.add_argument("--variants", type=int, default=1)
+    parser.add_argument("--split", default="1,4", help="tile rows,cols for the tiles scenario")
+    parser.add_argument("--json", help="also write the results here")
+    parser.add_argument("--metrics", help="write stage timings and counters here when done (.prom for Prometheus text, JSON otherwise)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    servers = [start_fake_comfy(latency=args.latency, per_image=args.per_image) for _ in range(args.servers)]
+    # Must be set before the scheduler is first used.
+    Config.COMFY_SERVERS = [server.address for server in servers]
+    Config.SERVER_ADDRESS = Config.COMFY_SERVERS[0]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+    try:
+        with stub_aws():
+            scenarios = Scenarios(args.asset_type, args.variants, tuple(int(n) for n in args.split.split(",")))
+            scenarios.prepare()
+            for name in args.scenarios.split(","):
+                operation = getattr(scenarios, name)
+                # Warm-up: template compile, connections and the fake server's noise image.
+                operation()
+                results[name] = [run_level(operation, level, args.requests, scenarios.flush) for level in levels]
+    finally:
+        # Mute the reconnect attempts of the app's websocket clients.
+        logging.getLogger("src.code").setLevel(logging.CRITICAL)
+        for server in servers:
+            server.stop()
+
+    for name, rows in results.items():
+        print(f"\n{name} ({args.servers} server(s), {args.latency:.2f} s render)")
+        print(f"{'conc':>5} {'ok/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7} {'peak RSS MiB':>13}")
+        for row in rows:
+            print(f"{row['concurrency']:>5} {row['throughput']:>8.2f} {row['p50'] * 1000:>9.0f} {row['p90'] * 1000:>9.0f} "
+                  f"{row['p99'] * 1000:>9.0f} {row['errors']:>7} {row['peak_rss_mib']:>13.1f}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.metrics:
+        metrics.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
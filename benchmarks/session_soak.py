@@ -0,0 +1,375 @@
+"""Multi-session load/soak test of the Streamlit pages against local stand-ins.
+
+Usage (from the repository root):
+    python -m benchmarks.session_soak --sessions 8 --duration 3600 --output soak.jsonl
+
+Each simulated session drives the real page scripts through Streamlit's
+AppTest, in its own thread, against fake ComfyUI servers
+(benchmarks/fake_comfy.py) and the moto AWS stubs (benchmarks/aws_stubs.py).
+Sessions pick their next action from --mix, with exponential think time
+between actions:
+
+    generate   page 1: character, obstacle or background "Generate Image"
+    split      page 1: split the session's background (generating one first if needed)
+    brandbook  page 2: upload a brandbook, "Generate prompt", "Generate full asset set"
+    rerun      rerun page 1 without input, as any widget change does
+
+Sessions end after --session-actions actions and a new one takes their place,
+so state that outlives its session shows up as growth. Every
+--report-interval seconds a line with rerun latency percentiles per action,
+errors, process RSS (total and per session above the idle baseline),
+image_store size and event-loop lag is printed and appended to --output as
+JSON. Lag is measured on the ComfyUI client loops and on a probe loop that
+stands in for the Streamlit server's own loop, which starves when reruns
+hold the GIL. The final summary includes the RSS trend in MiB/hour.
+
+AppTest runs scripts in-process without the Streamlit server, so
+websocket and front-end costs are not included; treat the numbers as a lower
+bound for the server side of one app instance.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from PIL import Image
+from streamlit import logger as streamlit_logger
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from benchmarks.aws_stubs import stub_aws
+from benchmarks.fake_comfy import start_fake_comfy
+from benchmarks.pipeline_throughput import current_rss, percentile
+from src.code.comfy_client import ComfyClient
+from src.code.config import Config
+from src.code.image_store import image_store
+
+logger = logging.getLogger("benchmarks.session_soak")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT_PAGE = os.path.join(ROOT, "src", "pages", "1_🎨Assest generator (ComfyUI only).py")
+BRANDBOOK_PAGE = os.path.join(ROOT, "src", "pages", "2_✨Brandbook asset generator.py")
+GENERATE_BUTTONS = {"character": "button 1", "obstacle": "button 2", "background": "button 3"}
+
+
+def share_apptest_state():
+    """Let AppTest runs overlap across threads, as sessions do on a real server.
+
+    AppTest installs a mock Runtime as the process-wide singleton for each run
+    and clears it when the run ends, which pulls it from under every other
+    session's script mid-run; fall back to the last installed mock instead.
+    Each run also compiles the page with a fresh ScriptCache, and concurrent
+    compiles of the same file can fail on CPython 3.11; share one cache like
+    the Streamlit server does.
+    """
+    installed = []
+
+    def current(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+        return installed[0] if installed else None
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+
+    shared_cache = ScriptCache()
+    get_bytecode = ScriptCache.get_bytecode
+    ScriptCache.get_bytecode = lambda self, script_path: get_bytecode(shared_cache, script_path)
+
+
+def make_brandbook(rng):
+    # A one-page PDF with a random colour, so every upload misses the Bedrock cache.
+    buffer = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (256, 256), color).save(buffer, format="PDF")
+    return buffer.getvalue()
+
+
+class Recorder:
+    """Thread-safe rerun latencies and errors, per action, since the last report."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window = defaultdict(list)
+        self._errors = defaultdict(int)
+        self.totals = defaultdict(list)
+        self.total_errors = defaultdict(int)
+        self.active_sessions = 0
+
+    def session_started(self):
+        with self._lock:
+            self.active_sessions += 1
+
+    def session_ended(self):
+        with self._lock:
+            self.active_sessions -= 1
+
+    def record(self, action, seconds, error=None):
+        with self._lock:
+            self._window[action].append(seconds)
+            self.totals[action].append(seconds)
+            if error:
+                self._errors[action] += 1
+                self.total_errors[action] += 1
+        if error:
+            logger.warning(f"{action}: {error}")
+
+    def take(self):
+        with self._lock:
+            window, errors = self._window, self._errors
+            self._window, self._errors = defaultdict(list), defaultdict(int)
+        return window, errors
+
+
+class LoopLagProbe:
+    """Measures how late asyncio.sleep(interval) wakes up on a running loop."""
+
+    def __init__(self, name, loop, interval=0.1):
+        self.name = name
+        self.interval = interval
+        self._lags = []
+        self._lock = threading.Lock()
+        asyncio.run_coroutine_threadsafe(self._probe(), loop)
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            with self._lock:
+                self._lags.append(max(loop.time() - start - self.interval, 0.0))
+
+    def take(self):
+        with self._lock:
+            lags, self._lags = sorted(self._lags), []
+        return lags
+
+
+def start_probe_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="soak-probe-loop", daemon=True).start()
+    return loop
+
+
+def run_page(recorder, action, at, interaction=None):
+    """Apply interaction (if any), rerun the script and record the rerun."""
+    start = time.perf_counter()
+    error = None
+    try:
+        if interaction:
+            interaction(at)
+        at.run()
+        if at.exception:
+            error = at.exception[0].value
+        elif at.error:
+            error = at.error[0].value
+    except Exception as e:
+        error = str(e)
+    recorder.record(action, time.perf_counter() - start, error)
+    return error is None
+
+
+class SimulatedSession:
+    def __init__(self, recorder, rng, timeout, brandbook=None):
+        self.recorder = recorder
+        self.rng = rng
+        self.timeout = timeout
+        self.brandbook = brandbook
+        self._pages = {}
+
+    def page(self, path):
+        at = self._pages.get(path)
+        if at is None:
+            at = self._pages[path] = AppTest.from_file(path, default_timeout=self.timeout)
+            run_page(self.recorder, "load", at)
+        return at
+
+    def generate(self, asset_type=None):
+        asset_type = asset_type or self.rng.choice(sorted(GENERATE_BUTTONS))
+        at = self.page(PROMPT_PAGE)
+        return run_page(self.recorder, f"generate_{asset_type}", at,
+                        lambda at: at.button(key=GENERATE_BUTTONS[asset_type]).click())
+
+    def split(self):
+        at = self.page(PROMPT_PAGE)
+        if not at.session_state["generated_image_background"] and not self.generate("background"):
+            return
+        run_page(self.recorder, "split", at, lambda at: at.button(key="button 4").click())
+
+    def brandbook_flow(self):
+        at = self.page(BRANDBOOK_PAGE)
+        brandbook = self.brandbook or make_brandbook(self.rng)
+
+        def upload_and_prompt(at):
+            at.file_uploader(key="pdf file").upload("brandbook.pdf", brandbook, "application/pdf")
+            at.button(key="button 4").click()
+
+        if run_page(self.recorder, "brandbook_prompt", at, upload_and_prompt):
+            run_page(self.recorder, "brandbook_asset_set", at, lambda at: at.button(key="button_all").click())
+
+    def rerun(self):
+        run_page(self.recorder, "rerun", self.page(PROMPT_PAGE))
+
+
+def session_loop(recorder, args, mix, stop, seed):
+    rng = random.Random(seed)
+    actions, weights = zip(*mix.items())
+    while not stop.is_set():
+        session = SimulatedSession(recorder, rng, Config.GENERATION_TIMEOUT + 30, args.brandbook_bytes)
+        recorder.session_started()
+        try:
+            for _ in range(args.session_actions):
+                if stop.wait(rng.expovariate(1 / args.think) if args.think else 0):
+                    return
+                action = rng.choices(actions, weights)[0]
+                {"generate": session.generate, "split": session.split,
+                 "brandbook": session.brandbook_flow, "rerun": session.rerun}[action]()
+        finally:
+            recorder.session_ended()
+
+
+def rss_trend(samples):
+    """Least-squares slope of (elapsed seconds, RSS bytes) samples, in MiB per hour."""
+    if len(samples) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / len(samples)
+    mean_rss = sum(rss for _, rss in samples) / len(samples)
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance:
+        return 0.0
+    slope = sum((t - mean_t) * (rss - mean_rss) for t, rss in samples) / variance
+    return slope * 3600 / 1024 ** 2
+
+
+def report(out, output, elapsed, recorder, probes, baseline_rss):
+    window, errors = recorder.take()
+    rss = current_rss()
+    sessions = recorder.active_sessions
+    line = {
+        "elapsed": round(elapsed, 1), "sessions": sessions,
+        "rss_mib": rss / 1024 ** 2,
+        "rss_per_session_mib": (rss - baseline_rss) / 1024 ** 2 / max(sessions, 1),
+        "image_store_mib": image_store.size / 1024 ** 2,
+        "actions": {
+            action: {"count": len(values), "errors": errors.get(action, 0),
+                     "p50": percentile(sorted(values), 0.5), "p95": percentile(sorted(values), 0.95),
+                     "max": max(values)}
+            for action, values in sorted(window.items())
+        },
+        "loop_lag": {},
+    }
+    for probe in probes:
+        lags = probe.take()
+        line["loop_lag"][probe.name] = {"p99": percentile(lags, 0.99), "max": max(lags) if lags else 0.0}
+    summary = ", ".join(f"{action} n={stats['count']} p50={stats['p50']:.2f}s p95={stats['p95']:.2f}s err={stats['errors']}"
+                        for action, stats in line["actions"].items())
+    lag = max((stats["max"] for stats in line["loop_lag"].values()), default=0.0)
+    print(f"[{elapsed:7.0f}s] {line['sessions']} sessions, RSS {line['rss_mib']:.0f} MiB "
+          f"({line['rss_per_session_mib']:.1f}/session), store {line['image_store_mib']:.0f} MiB, "
+          f"max loop lag {lag * 1000:.0f} ms | {summary}", file=out, flush=True)
+    if output:
+        output.write(json.dumps(line) + "\n")
+        output.flush()
+    return rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=600, help="seconds to run")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds over which sessions start")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time between actions (seconds)")
+    parser.add_argument("--session-actions", type=int, default=20, help="actions before a session is replaced")
+    parser.add_argument("--mix", default="generate=4,split=2,brandbook=1,rerun=3", help="action weights")
+    parser.add_argument("--servers", type=int, default=1, help="fake ComfyUI servers")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake render seconds per prompt")
+    parser.add_argument("--bedrock-latency", type=float, default=2.0, help="stubbed Bedrock seconds per call")
+    parser.add_argument("--brandbook", help="PDF to upload (default: a fresh synthetic one per upload)")
+    parser.add_argument("--report-interval", type=float, default=30)
+    parser.add_argument("--s3-retention", type=float, default=600,
+                        help="seconds stub S3 objects are kept; older ones are purged to bound moto's memory")
+    parser.add_argument("--output", help="append one JSON report per interval here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    args.brandbook_bytes = None
+    if args.brandbook:
+        with open(args.brandbook, "rb") as file:
+            args.brandbook_bytes = file.read()
+
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler])
+    streamlit_logger.set_log_level("error")
+    # Warns on every AppTest run from a session thread; expected here.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    share_apptest_state()
+
+    servers = [start_fake_comfy(latency=args.latency) for _ in range(args.servers)]
+    # Must be set before the pages first touch the scheduler.
+    Config.COMFY_SERVERS = [server.address for server in servers]
+    Config.SERVER_ADDRESS = Config.COMFY_SERVERS[0]
+    probes = [LoopLagProbe("streamlit", start_probe_loop())]
+    probes += [LoopLagProbe(f"comfy {address}", ComfyClient.for_server(address).loop) for address in Config.COMFY_SERVERS]
+
+    out = sys.stdout
+    output = open(args.output, "a") if args.output else None
+    recorder = Recorder()
+    stop = threading.Event()
+    samples = []
+    try:
+        with stub_aws(bedrock_latency=args.bedrock_latency) as stubs:
+            baseline_rss = current_rss()
+            threads = []
+            for index in range(args.sessions):
+                thread = threading.Thread(
+                    target=session_loop, args=(recorder, args, mix, stop, args.seed + index),
+                    name=f"soak-session-{index}", daemon=True
+                )
+                threads.append(thread)
+                thread.start()
+                time.sleep(args.ramp / args.sessions)
+            start = time.monotonic()
+            while not stop.wait(args.report_interval):
+                elapsed = time.monotonic() - start
+                stubs.purge_s3(args.s3_retention)
+                samples.append((elapsed, report(out, output, elapsed, recorder, probes, baseline_rss)))
+                if elapsed >= args.duration:
+                    stop.set()
+            for thread in threads:
+                thread.join()
+    finally:
+        stop.set()
+        logging.getLogger("src.code").setLevel(logging.CRITICAL)
+        for server in servers:
+            server.stop()
+        if output:
+            output.close()
+
+    print("\nrerun latency over the whole run", file=out)
+    print(f"{'action':>22} {'count':>6} {'errors':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7}", file=out)
+    for action, values in sorted(recorder.totals.items()):
+        values.sort()
+        print(f"{action:>22} {len(values):>6} {recorder.total_errors.get(action, 0):>7} {percentile(values, 0.5):>7.2f} "
+              f"{percentile(values, 0.95):>7.2f} {percentile(values, 0.99):>7.2f} {values[-1]:>7.2f}", file=out)
+    # Skip the first samples, while caches and the image store fill up.
+    if len(samples) >= 8:
+        print(f"RSS trend: {rss_trend(samples[len(samples) // 4:]):+.1f} MiB/hour", file=out)
+    else:
+        print("RSS trend: run longer (at least 8 report intervals) for a meaningful trend", file=out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.code.config import Config
+from src.code.dynamo_adapter import DynamoAdapter
+from src.code.image_store import image_store
+from src.code.s3_adapter import save_img_s3_buffer
+from src.code.workflow import Workflow
+
+logger = logging.getLogger(__name__)
+
+# Backgrounds are uploaded as tiles once the user splits them, as on the single-asset flow.
+UPLOADED_ASSET_TYPES = ("character", "obstacle")
+
+# Shared by every session so background uploads stay bounded.
+_uploads = ThreadPoolExecutor(max_workers=Config.S3_UPLOAD_WORKERS, thread_name_prefix="asset-upload")
+
+
+def _upload(asset_type, image, prompt, handle):
+    try:
+        s3_key = save_img_s3_buffer(asset_type, image.open())
+        DynamoAdapter(logger, Config.TABLE_NAME, buffered=True).save_chat_history_record(s3_key, prompt)
+        image_store.attach_s3(handle, s3_key)
+    except Exception as e:
+        logger.error(f"Error: background upload of a {asset_type} failed: {e}")
+
+
+def generate_asset_set(prompts, variants=None, deterministic=Config.GENERATION_DETERMINISTIC):
+    """Render several asset types concurrently and yield (asset_type, handles) as each finishes.
+
+    prompts maps asset types to prompts, variants optionally maps them to a
+    variant count. Every workflow is queued at once, so a full kit takes about
+    as long as its slowest render. handles are image_store handles (empty if
+    that asset failed); S3 uploads and registry writes continue in the
+    background after the images are yielded.
+    """
+    variants = variants or {}
+
+    def generate(asset_type):
+        # Worker threads have no Streamlit context: report through the logger.
+        workflow = Workflow(logger=logger, deterministic=deterministic)
+        return workflow.generate_asset(asset_type, prompts[asset_type], int(variants.get(asset_type, 1)))
+
+    with ThreadPoolExecutor(max_workers=max(len(prompts), 1)) as executor:
+        futures = {executor.submit(generate, asset_type): asset_type for asset_type in prompts}
+        for future in as_completed(futures):
+            asset_type = futures[future]
+            try:
+                images = future.result()
+            except Exception as e:
+                logger.error(f"Error: {asset_type} generation failed: {e}")
+                yield asset_type, []
+                continue
+            handles = [image_store.put(image) for image in images]
+            if asset_type in UPLOADED_ASSET_TYPES:
+                for image, handle in zip(images, handles):
+                    _uploads.submit(_upload, asset_type, image, prompts[asset_type], handle)
+            yield asset_type, handles
@@ -0,0 +1,50 @@
+import threading
+import boto3
+from botocore.config import Config as BotoConfig
+from src.code.config import Config
+
+# Process-wide boto3 clients shared by the S3 helpers, DynamoAdapter and the
+# Bedrock pipeline, so credential resolution, endpoint setup and TLS
+# connections are paid once instead of on every click. Clients are
+# thread-safe; resources are not, so only clients are handed out.
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def _boto_config():
+    return BotoConfig(
+        region_name=Config.REGION_NAME,
+        max_pool_connections=Config.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"mode": "adaptive", "max_attempts": Config.AWS_MAX_ATTEMPTS}
+    )
+
+
+def _get_session():
+    # boto3 sessions are not thread-safe; only touch it under _lock.
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(region_name=Config.REGION_NAME)
+    return _session
+
+
+def get_client(service_name):
+    with _lock:
+        client = _clients.get(service_name)
+        if client is None:
+            client = _get_session().client(
+                service_name,
+                config=_boto_config(),
+                endpoint_url=Config.AWS_ENDPOINT_URL
+            )
+            _clients[service_name] = client
+        return client
+
+
+def reset():
+    """Drop the cached session and clients, e.g. after changing Config.AWS_ENDPOINT_URL."""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
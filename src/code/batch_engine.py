@@ -0,0 +1,178 @@
+"""Headless bulk asset generation: manifest -> Workflow -> S3 upload -> prompt registry.
+
+Each manifest (JSONL) line describes one asset set:
+
+    {"id": "katty", "prompt": "Pixel art ...", "asset_types": ["character"], "variants": 4}
+    {"id": "acme", "prompts": {"character": "...", "background": "..."}, "split": [1, 4]}
+    {"id": "acme-bb", "brandbook": "brandbooks/acme.pdf"}
+
+"prompt" applies to every asset type, "prompts" sets one per type, and
+"brandbook" derives the prompts through recommendation_pipeline. asset_types
+defaults to all three, variants to 1 (at most Config.MAX_BATCH_SIZE, as on
+the pages), and "split" tiles backgrounds.
+
+Usage (from the repository root):
+    python -m src.code.batch_engine manifest.jsonl --concurrency 8 --checkpoint manifest.ckpt.jsonl
+
+Completed jobs are appended to the checkpoint file; re-running the same
+command resumes and skips them.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.code.bedrock_pipeline import recommendation_pipeline
+from src.code.config import Config
+from src.code.dynamo_adapter import DynamoAdapter
+from src.code.scheduler import Priority
+from src.code.s3_adapter import save_img_s3_buffer, save_img_s3_tiles
+from src.code.telemetry import metrics
+from src.code.tiling import split_image_into_tiles
+from src.code.workflow import Workflow
+
+BRANDBOOK_PROMPT_KEYS = {
+    "character": "Character prompt",
+    "obstacle": "Obstacles prompt",
+    "background": "Background prompt",
+}
+
+
+class BatchEngine:
+    def __init__(self, logger, concurrency=4, checkpoint_path=None, deterministic=Config.GENERATION_DETERMINISTIC):
+        self.logger = logger
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.workflow = Workflow(logger=logger, priority=Priority.BULK, deterministic=deterministic)
+        self.dyna = DynamoAdapter(logger, Config.TABLE_NAME, buffered=True)
+        self._checkpoint_lock = threading.Lock()
+        self._brandbook_prompts = {}
+        self._brandbook_locks = defaultdict(threading.Lock)
+        self._brandbook_locks_lock = threading.Lock()
+
+    # --- Manifest and checkpoint ---
+    def load_jobs(self, manifest_path):
+        jobs = []
+        with open(manifest_path, "r") as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry_id = entry.get("id", f"line-{line_number}")
+                variants = entry.get("variants", 1)
+                if not isinstance(variants, int) or not 1 <= variants <= Config.MAX_BATCH_SIZE:
+                    raise ValueError(f"variants must be 1-{Config.MAX_BATCH_SIZE} on manifest line {line_number}, got {variants!r}")
+                for asset_type in entry.get("asset_types", list(Config.ASSET_WORKFLOWS)):
+                    if asset_type not in Config.ASSET_WORKFLOWS:
+                        raise ValueError(f"Unknown asset type '{asset_type}' on manifest line {line_number}")
+                    jobs.append({"job_id": f"{entry_id}:{asset_type}", "asset_type": asset_type, "entry": entry})
+        return jobs
+
+    def load_completed(self):
+        completed = set()
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get("status") == "done":
+                            completed.add(record["job_id"])
+        return completed
+
+    def _checkpoint(self, record):
+        if not self.checkpoint_path:
+            return
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+
+    # --- Pipeline ---
+    def _prompt_for(self, job):
+        entry = job["entry"]
+        if "prompts" in entry:
+            return entry["prompts"][job["asset_type"]]
+        if "prompt" in entry:
+            return entry["prompt"]
+        brandbook = entry["brandbook"]
+        # Asset types of the same brandbook run concurrently; only one asks Bedrock.
+        with self._brandbook_locks_lock:
+            lock = self._brandbook_locks[brandbook]
+        with lock:
+            if brandbook not in self._brandbook_prompts:
+                with open(brandbook, "rb") as file:
+                    output = recommendation_pipeline(file.read())
+                if not output:
+                    raise RuntimeError(f"Bedrock returned no prompts for {brandbook}")
+                self._brandbook_prompts[brandbook] = {key.rstrip(":").strip(): value for key, value in output.items()}
+        return self._brandbook_prompts[brandbook][BRANDBOOK_PROMPT_KEYS[job["asset_type"]]]
+
+    def run_job(self, job):
+        asset_type = job["asset_type"]
+        entry = job["entry"]
+        prompt = self._prompt_for(job)
+        s3_keys = []
+        for image in self.workflow.generate_asset(asset_type, prompt, entry.get("variants", 1)):
+            # Upload the PNG exactly as ComfyUI encoded it.
+            s3_key = save_img_s3_buffer(asset_type, image.open())
+            self.dyna.save_chat_history_record(s3_key, prompt)
+            s3_keys.append(s3_key)
+            if asset_type == "background" and entry.get("split"):
+                rows, cols = entry["split"]
+                tiles = split_image_into_tiles(image.pil, rows, cols)
+                folder_key = save_img_s3_tiles("background", tiles)
+                self.dyna.save_chat_history_record(folder_key, prompt)
+                s3_keys.append(folder_key)
+        return s3_keys
+
+    def run(self, manifest_path):
+        jobs = self.load_jobs(manifest_path)
+        completed = self.load_completed()
+        pending = [job for job in jobs if job["job_id"] not in completed]
+        self.logger.info(f"{len(jobs)} jobs in manifest, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+
+        failures = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.run_job, job): job for job in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    record = {"job_id": job["job_id"], "status": "done", "s3_keys": future.result()}
+                except Exception as e:
+                    failures += 1
+                    record = {"job_id": job["job_id"], "status": "failed", "error": str(e)}
+                    self.logger.error(f"Error: job {job['job_id']} failed: {e}")
+                self._checkpoint(record)
+                self.logger.info(f"[{done}/{len(pending)}] {job['job_id']}: {record['status']}")
+        self.dyna.writer.flush()
+        return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL manifest of asset sets to generate")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight at once")
+    parser.add_argument("--checkpoint", help="JSONL checkpoint file (default: <manifest>.ckpt.jsonl)")
+    parser.add_argument("--deterministic", action="store_true", default=Config.GENERATION_DETERMINISTIC,
+                        help="keep template seeds and reuse cached generations of identical workflows")
+    parser.add_argument("--metrics", help="write stage timings and counters here when done (.prom for Prometheus text, JSON otherwise)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    engine = BatchEngine(
+        logging.getLogger("batch_engine"),
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint or f"{args.manifest}.ckpt.jsonl",
+        deterministic=args.deterministic
+    )
+    failures = engine.run(args.manifest)
+    if args.metrics:
+        metrics.dump(args.metrics)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
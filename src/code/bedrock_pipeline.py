@@ -0,0 +1,162 @@
+import ast
+import json
+import logging
+import re
+from src.code.aws_clients import get_client
+from src.code.brandbook_preprocessing import compact_brandbook, payload_size
+from src.code.config import Config
+from src.code.incremental_json import IncrementalDictParser
+from src.code.result_cache import ResultCache, cache_key
+from src.code.telemetry import span, traced
+
+logger = logging.getLogger(__name__)
+
+JSON_SCHEMA = {
+    "Character prompt" : "(JSON string)",
+    "Obstacles prompt:" : "(JSON string)",
+    "Background prompt:" : "(JSON string)"
+}
+
+PROMPT_TEMPLATE = (
+    "Base on the brand book information provided, generate a single, compact and detail prompt for image generating characters, obstacles and background for a one-tapping game. \n"
+    "**Character prompt:**"
+    "Create the character using as guide the following prompt: Pixel art a detailed, full-body, character of a cute and cheerful brown cat name Katty. Katty is wearing a vibrant blue retro witch dress and hat. Cute and smiling face. The art style is crisp and clean, with a simple color palette that highlights the character's features. Add running cycle pose on mid air. \n"
+    "**Obstacles prompt:**"
+    "Create the obstacles using as guide the following prompt: Vertical obstacles shaped like magical crystal spires for a fantasy mobile game. Tall, jagged crystalline columns glowing in bright colors (blue, purple, pink), semi-transparent with shiny facets. Stylized, clean, playful design with glowing edges and magical aura. Vector-like style, smooth and iconic, suitable for 2D game assets. White or transparent background. High resolution."
+    "**Background prompt:**"
+    "Create the background using as guide the following prompt: A 2D rendered game scene, 16-bit retro pixel art, retro video game, flappy bird-like style. Bright colorful sky with a magical gradient (purple, pink, and turquoise). Floating glowing clouds and sparkles in the air. Mystical floating islands and crystal mountains in the distance. Flatten, runnable ground area made of enchanted grass with glowing flowers and mushrooms. Playful, vibrant, whimsical style with smooth vector-like shading, clean and iconic, suitable for 2D mobile game assets. "
+    "Provided results as a json with any aditional details, just the json format output \n"
+    "Provide results with the follow schema:"
+    f"{JSON_SCHEMA}"
+)
+
+# Keyed by brandbook content hash + prompt template + model id, so a repeated
+# brandbook (or a second click) never reaches Bedrock again.
+recommendation_cache = ResultCache(
+    "bedrock",
+    ttl=Config.BEDROCK_CACHE_TTL,
+    max_entries=Config.BEDROCK_CACHE_MAX_ENTRIES,
+    max_disk_bytes=Config.BEDROCK_CACHE_MAX_DISK_BYTES
+)
+
+
+@traced("bedrock.build_content")
+def build_brandbook_content(document_bytes_1, preprocess=True):
+    if preprocess:
+        try:
+            content = compact_brandbook(document_bytes_1)
+            if content:
+                return content
+            logger.info("Brandbook pre-processing found nothing, sending the whole PDF")
+        except Exception as e:
+            logger.error(f"Error during brandbook pre-processing: {str(e)}")
+    return [
+        {
+            "document": {
+                # Available formats: html, md, pdf, doc/docx, xls/xlsx, csv, and txt
+                "format": "pdf",
+                "name": "asset-related",
+                "source": {"bytes": document_bytes_1},
+            }
+        },
+    ]
+
+
+def recommendation_pipeline(document_bytes_1, preprocess=Config.BRANDBOOK_PREPROCESS, use_cache=True):
+    if not document_bytes_1:
+        return ""
+    else:
+        try:
+            key = cache_key(document_bytes_1, PROMPT_TEMPLATE, Config.BEDROCK_MODEL_ID, f"preprocess={preprocess}")
+            cached = recommendation_cache.get(key) if use_cache else None
+            if cached is not None:
+                logger.info("Bedrock response served from cache")
+                return json.loads(cached)
+
+            # Create a Bedrock Runtime client in the AWS Region you want to use.
+            logger.info("Initiate bedrock client")
+            bedrock_runtime = get_client("bedrock-runtime")
+            conversation= [
+                {
+                    "role": "user",
+                    "content": [{"text": PROMPT_TEMPLATE}] + build_brandbook_content(document_bytes_1, preprocess),
+                }
+            ]
+
+            # Get Bedrock response
+            logger.info("Initiate bedrock response")
+            with span("bedrock.converse", model=Config.BEDROCK_MODEL_ID) as current:
+                current.add_bytes(payload_size(conversation[0]["content"]), "out")
+                response = bedrock_runtime.converse(
+                    modelId=Config.BEDROCK_MODEL_ID,
+                    messages=conversation,
+                    inferenceConfig={"maxTokens": 2048, "temperature": 0.3},
+                )
+            # Extract the response text.
+            logger.info("Cleaning bedrock response")
+            response_output = response["output"]["message"]["content"][0]["text"]
+
+            clean_output = re.sub(r"```json|```", "", response_output).strip()
+            data_dict = ast.literal_eval(clean_output)
+            if use_cache:
+                recommendation_cache.put(key, json.dumps(data_dict).encode("utf-8"))
+            return data_dict
+        except Exception as e:
+            logger.error(f"Error during KB + Bedrock integration: {str(e)}")
+
+
+def recommendation_pipeline_stream(document_bytes_1, on_prompt=None, preprocess=Config.BRANDBOOK_PREPROCESS, use_cache=True):
+    """Streaming variant of recommendation_pipeline built on converse_stream.
+
+    on_prompt(key, value) is called on the calling thread as soon as each
+    prompt in the JSON answer is complete. Output that is not a JSON object is
+    detected on the first offending chunk and the stream is abandoned.
+    """
+    if not document_bytes_1:
+        return ""
+    try:
+        key = cache_key(document_bytes_1, PROMPT_TEMPLATE, Config.BEDROCK_MODEL_ID, f"preprocess={preprocess}")
+        cached = recommendation_cache.get(key) if use_cache else None
+        if cached is not None:
+            logger.info("Bedrock response served from cache")
+            data_dict = json.loads(cached)
+            if on_prompt:
+                for prompt_key, value in data_dict.items():
+                    on_prompt(prompt_key, value)
+            return data_dict
+
+        logger.info("Initiate bedrock client")
+        bedrock_runtime = get_client("bedrock-runtime")
+        conversation = [
+            {
+                "role": "user",
+                "content": [{"text": PROMPT_TEMPLATE}] + build_brandbook_content(document_bytes_1, preprocess),
+            }
+        ]
+
+        logger.info("Initiate bedrock streaming response")
+        with span("bedrock.converse_stream", model=Config.BEDROCK_MODEL_ID) as current:
+            current.add_bytes(payload_size(conversation[0]["content"]), "out")
+            response = bedrock_runtime.converse_stream(
+                modelId=Config.BEDROCK_MODEL_ID,
+                messages=conversation,
+                inferenceConfig={"maxTokens": 2048, "temperature": 0.3},
+            )
+            stream = response["stream"]
+            parser = IncrementalDictParser()
+            try:
+                for event in stream:
+                    text = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+                    if not text:
+                        continue
+                    for prompt_key, value in parser.feed(text):
+                        if on_prompt:
+                            on_prompt(prompt_key, value)
+            finally:
+                stream.close()
+        data_dict = parser.close()
+        if use_cache:
+            recommendation_cache.put(key, json.dumps(data_dict).encode("utf-8"))
+        return data_dict
+    except Exception as e:
+        logger.error(f"Error during KB + Bedrock integration: {str(e)}")
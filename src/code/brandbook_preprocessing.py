@@ -0,0 +1,114 @@
+import hashlib
+import io
+import logging
+import re
+from PIL import Image
+from pypdf import PdfReader
+from src.code.config import Config
+
+logger = logging.getLogger(__name__)
+
+BRAND_KEYWORDS = (
+    "color", "colour", "palette", "pantone", "cmyk", "rgb", "hex",
+    "typography", "typeface", "font", "logo", "character", "mascot",
+    "illustration", "style", "tone"
+)
+HEX_COLOR = re.compile(r"#[0-9a-fA-F]{6}\b")
+MIN_IMAGE_SIDE = 64
+
+
+def _page_score(text):
+    lowered = text.lower()
+    return sum(lowered.count(keyword) for keyword in BRAND_KEYWORDS) + 2 * len(HEX_COLOR.findall(text))
+
+
+def _has_images(page):
+    try:
+        return len(page.images) > 0
+    except Exception:
+        return False
+
+
+def _select_pages(page_texts, image_pages):
+    # Keep the cover (brand identity) plus the pages richest in palette,
+    # typography and style vocabulary; leftover budget goes to pages with
+    # images (logos, palettes, mascots), in document order.
+    ranked = sorted(range(1, len(page_texts)), key=lambda i: _page_score(page_texts[i]), reverse=True)
+    selected = ([0] + [i for i in ranked if _page_score(page_texts[i]) > 0])[:Config.BRANDBOOK_MAX_PAGES]
+    for i in image_pages:
+        if len(selected) >= Config.BRANDBOOK_MAX_PAGES:
+            break
+        if i not in selected:
+            selected.append(i)
+    return sorted(selected)
+
+
+def _compact_image(data):
+    image = Image.open(io.BytesIO(data))
+    if min(image.size) < MIN_IMAGE_SIDE:
+        return None
+    image.thumbnail((Config.BRANDBOOK_IMAGE_MAX_SIDE, Config.BRANDBOOK_IMAGE_MAX_SIDE))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def compact_brandbook(pdf_bytes):
+    """Reduce a brandbook PDF to Bedrock content blocks: relevant text plus a few images.
+
+    Returns None when nothing useful could be extracted or the selected pages
+    hold almost no text, in which case the caller should fall back to
+    attaching the whole PDF.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_texts = [page.extract_text() or "" for page in reader.pages]
+    if not page_texts:
+        return None
+    pages = _select_pages(page_texts, [i for i, page in enumerate(reader.pages) if _has_images(page)])
+
+    text = "\n\n".join(f"[Page {i + 1}]\n{page_texts[i].strip()}" for i in pages if page_texts[i].strip())
+    text = text[:Config.BRANDBOOK_MAX_TEXT_CHARS]
+    if len(text) < Config.BRANDBOOK_MIN_TEXT_CHARS:
+        # Mostly pictures (or scanned pages): Bedrock reads the PDF better than a few extracted images.
+        logger.info(f"Brandbook has only {len(text)} characters of text on the selected pages")
+        return None
+
+    images = []
+    seen = set()
+    for i in pages:
+        for page_image in reader.pages[i].images:
+            if len(images) >= Config.BRANDBOOK_MAX_IMAGES:
+                break
+            digest = hashlib.sha256(page_image.data).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            try:
+                compacted = _compact_image(page_image.data)
+            except Exception as e:
+                logger.info(f"Skipping brandbook image {page_image.name}: {e}")
+                continue
+            if compacted:
+                images.append(compacted)
+
+    if not text and not images:
+        return None
+    content = []
+    if text:
+        content.append({"text": f"Brand book content (selected pages):\n{text}"})
+    for image in images:
+        content.append({"image": {"format": "jpeg", "source": {"bytes": image}}})
+    return content
+
+
+def payload_size(content):
+    """Approximate request size in bytes of a list of converse content blocks."""
+    size = 0
+    for block in content:
+        if "text" in block:
+            size += len(block["text"].encode("utf-8"))
+        else:
+            size += len(next(iter(block.values()))["source"]["bytes"])
+    return size
@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import http.client
+import json
+import logging
+import queue
+import threading
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+
+import websockets
+from src.code.config import Config
+from src.code.resilience import SubmissionUnknownError, backoff_delay
+from src.code.telemetry import metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Nodes whose binary frames are final results rather than sampler previews.
+OUTPUT_NODE_CLASSES = ("ETN_SendImageWebSocket", "SaveImageWebsocket")
+
+
+class ComfyJob:
+    """Results and progress events collected from the websocket for a single prompt_id."""
+
+    def __init__(self, loop):
+        self.future = loop.create_future()
+        # (node, encoded image) for output frames (and any frame received before output_nodes is known)
+        self.frames = []
+        # Unknown until registered by queue_prompt; then previews are told apart from outputs.
+        self.output_nodes = None
+        self.events = queue.Queue(maxsize=Config.COMFY_EVENT_BUFFER)
+
+    def images(self):
+        return [data for node, data in self.frames if self.output_nodes is None or node in self.output_nodes]
+
+    def emit(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            pass
+
+
+class ComfyClient:
+    """Long-lived ComfyUI websocket client shared by every session of the app.
+
+    One websocket is kept open per server with a stable ``clientId``. Messages
+    for every in-flight ``prompt_id`` are routed to per-job futures, so many
+    generations can wait on the same connection without a handshake per image.
+    The asyncio loop runs in a daemon thread; Streamlit code uses the blocking
+    ``wait`` helper, async callers can await ``result`` on ``client.loop``.
+    Progress, node and preview messages are exposed per prompt via ``events``.
+    """
+
+    MAX_UNCLAIMED_JOBS = 256
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, server_address):
+        self.server_address = server_address
+        self.client_id = str(uuid.uuid4())
+        self._jobs = OrderedDict()
+        # sha256 of uploaded input images -> name to reference them by in workflows
+        self._uploaded = {}
+        self._uploaded_lock = threading.Lock()
+        self._current_prompt_id = None
+        self._current_node = None
+        self._connected = threading.Event()
+        self._connect_listeners = []
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever,
+            name=f"comfy-client-{server_address}",
+            daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self.loop)
+
+    @classmethod
+    def for_server(cls, server_address):
+        with cls._clients_lock:
+            client = cls._clients.get(server_address)
+            if client is None:
+                client = cls(server_address)
+                cls._clients[server_address] = client
+            return client
+
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def add_connect_listener(self, callback):
+        """Call ``callback()`` from the client's loop thread whenever the websocket (re)connects."""
+        self._connect_listeners.append(callback)
+
+    async def result(self, prompt_id):
+        """Await the list of encoded output images produced by ``prompt_id``."""
+        job = self._job(prompt_id)
+        try:
+            await asyncio.shield(job.future)
+            return job.images()
+        finally:
+            self._jobs.pop(prompt_id, None)
+
+    def events(self, prompt_id):
+        """Thread-safe queue of progress/executing/execution_cached/preview events for ``prompt_id``.
+
+        Prompts that already finished and were collected (or are unknown) get
+        an empty queue; no job is created for them.
+        """
+        async def get_events():
+            job = self._jobs.get(prompt_id)
+            return job.events if job is not None else queue.Queue()
+        return asyncio.run_coroutine_threadsafe(get_events(), self.loop).result()
+
+    def result_future(self, prompt_id):
+        """``result`` as a concurrent.futures.Future for non-async callers."""
+        return asyncio.run_coroutine_threadsafe(self.result(prompt_id), self.loop)
+
+    def wait(self, prompt_id, timeout=None):
+        """Blocking bridge to ``result`` for non-async callers."""
+        return self.result_future(prompt_id).result(timeout)
+
+    def queue_prompt(self, prompt):
+        """POST a workflow to /prompt tagged with our clientId; HTTP errors propagate.
+
+        Failures after the request went out (no or a broken response) raise
+        SubmissionUnknownError: the prompt may be queued, so it must not be resent.
+        """
+        data = json.dumps({"prompt": prompt, "client_id": self.client_id}).encode('utf-8')
+        req = urllib.request.Request(f"http://{self.server_address}/prompt", data=data, headers={"Content-Type": "application/json"})
+        with span("comfy.http_prompt", server=self.server_address) as current:
+            current.add_bytes(len(data), "out")
+            try:
+                with urllib.request.urlopen(req, timeout=Config.HTTP_TIMEOUT) as response:
+                    result = json.loads(response.read())
+            except urllib.error.URLError:
+                # urllib wraps errors while connecting and sending; HTTPError is a real answer.
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                raise SubmissionUnknownError(f"No response to /prompt from {self.server_address}: {e}") from e
+        output_nodes = {node_id for node_id, node in prompt.items() if node.get("class_type") in OUTPUT_NODE_CLASSES}
+        if output_nodes:
+            self.loop.call_soon_threadsafe(self._register, result["prompt_id"], output_nodes)
+        return result
+
+    def upload_image(self, image_bytes):
+        """Upload an input image once per server and return the name LoadImage refers to it by.
+
+        Files are named by content hash under Config.COMFY_UPLOAD_SUBFOLDER, so
+        repeated references (logos, style images) are only sent the first time.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._uploaded_lock:
+            name = self._uploaded.get(digest)
+        if name is not None:
+            metrics.increment("comfy_upload_requests_total", result="reused")
+            return name
+        extension = "jpg" if image_bytes[:3] == b"\xff\xd8\xff" else "png"
+        boundary = uuid.uuid4().hex
+        fields = (("overwrite", b"true"), ("type", b"input"), ("subfolder", Config.COMFY_UPLOAD_SUBFOLDER.encode('utf-8')))
+        body = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n'.encode('utf-8') + value + b"\r\n"
+            for field, value in fields
+        ) + (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{digest}.{extension}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8') + image_bytes + f"\r\n--{boundary}--\r\n".encode('utf-8')
+        req = urllib.request.Request(
+            f"http://{self.server_address}/upload/image",
+            data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        with span("comfy.upload_image", server=self.server_address) as current:
+            current.add_bytes(len(body), "out")
+            with urllib.request.urlopen(req, timeout=Config.HTTP_TIMEOUT) as response:
+                result = json.loads(response.read())
+        metrics.increment("comfy_upload_requests_total", result="uploaded")
+        name = f"{result['subfolder']}/{result['name']}" if result.get("subfolder") else result["name"]
+        with self._uploaded_lock:
+            self._uploaded[digest] = name
+        return name
+
+    def cancel(self, prompt_id):
+        """Drop ``prompt_id`` from the server queue, or interrupt it if it is the prompt running now."""
+        self._post("queue", {"delete": [prompt_id]})
+        # Servers that ignore the prompt_id body interrupt whatever is running,
+        # which may be another session's prompt.
+        if self._current_prompt_id == prompt_id:
+            self._post("interrupt", {"prompt_id": prompt_id})
+
+    def _post(self, path, body):
+        req = urllib.request.Request(
+            f"http://{self.server_address}/{path}",
+            data=json.dumps(body).encode('utf-8'),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(req, timeout=Config.HTTP_TIMEOUT):
+            pass
+
+    # --- Websocket routing ---
+    async def _listen(self):
+        url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+        attempt = 0
+        while True:
+            try:
+                async with websockets.connect(url, max_size=None, open_timeout=Config.WS_CONNECT_TIMEOUT) as ws:
+                    logger.info(f"ComfyUI websocket connected: {url}")
+                    attempt = 0
+                    self._connected.set()
+                    for callback in self._connect_listeners:
+                        callback()
+                    async for message in ws:
+                        if isinstance(message, str):
+                            self._on_text(json.loads(message))
+                        else:
+                            self._on_binary(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error: {e}")
+            self._connected.clear()
+            # Events for in-flight prompts are lost while disconnected.
+            self._fail_pending(ConnectionError(f"Lost websocket connection to {self.server_address}"))
+            # Jittered so clients of a restarted server do not reconnect in lockstep.
+            attempt += 1
+            await asyncio.sleep(backoff_delay(attempt))
+
+    def _on_text(self, message):
+        msg_type = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if msg_type == "execution_start":
+            self._current_prompt_id = prompt_id
+            self._current_node = None
+        elif msg_type == "executing":
+            if data.get("node") is None:
+                if self._current_prompt_id == prompt_id:
+                    self._current_prompt_id = None
+                self._finish(prompt_id)
+            else:
+                self._current_prompt_id = prompt_id
+                self._current_node = data["node"]
+                self._job(prompt_id).emit({"type": "executing", "node": data["node"]})
+        elif msg_type == "execution_cached":
+            self._job(prompt_id).emit({"type": "execution_cached", "nodes": data.get("nodes", [])})
+        elif msg_type == "progress":
+            self._job(prompt_id).emit({
+                "type": "progress", "value": data.get("value"), "max": data.get("max"), "node": data.get("node")
+            })
+        elif msg_type in ("execution_error", "execution_interrupted"):
+            reason = data.get("exception_message", msg_type)
+            self._fail(prompt_id, RuntimeError(f"Prompt {prompt_id} failed: {reason}"))
+
+    def _on_binary(self, message):
+        # Binary frames carry no prompt_id; ComfyUI executes one prompt at a
+        # time, so they belong to whichever prompt is currently executing.
+        if self._current_prompt_id is None:
+            return
+        job = self._job(self._current_prompt_id)
+        # 4 bytes event type + 4 bytes image format, then the encoded image.
+        # A memoryview skips the header without copying the frame.
+        image = memoryview(message)[8:]
+        if job.output_nodes is not None and self._current_node not in job.output_nodes:
+            # Previews only go to the event queue; keeping them would hold memory until the job ends.
+            job.emit({"type": "preview", "node": self._current_node, "image": image})
+        else:
+            job.frames.append((self._current_node, image))
+
+    def _register(self, prompt_id, output_nodes):
+        self._job(prompt_id).output_nodes = output_nodes
+
+    def _job(self, prompt_id):
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            job = ComfyJob(self.loop)
+            self._jobs[prompt_id] = job
+            self._evict_unclaimed()
+        return job
+
+    def _evict_unclaimed(self):
+        # Oldest finished jobs go first; jobs still waiting on the server are skipped, not a barrier.
+        excess = len(self._jobs) - self.MAX_UNCLAIMED_JOBS
+        if excess <= 0:
+            return
+        for prompt_id in [prompt_id for prompt_id, job in self._jobs.items() if job.future.done()][:excess]:
+            del self._jobs[prompt_id]
+
+    def _finish(self, prompt_id):
+        job = self._job(prompt_id)
+        job.emit({"type": "done"})
+        if not job.future.done():
+            job.future.set_result(None)
+
+    def _fail(self, prompt_id, error):
+        if prompt_id == self._current_prompt_id:
+            self._current_prompt_id = None
+        job = self._job(prompt_id)
+        job.emit({"type": "error", "error": str(error)})
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _fail_pending(self, error):
+        self._current_prompt_id = None
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.set_exception(error)
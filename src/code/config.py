@@ -3,6 +3,80 @@ import os
 
 class Config:
     SERVER_ADDRESS = "3.125.95.236:8188"  #os.getenv("MODEL_ID")
+    WS_CONNECT_TIMEOUT = 10
+    HTTP_TIMEOUT = 10
+    # Progress/preview events buffered per prompt for the UI
+    COMFY_EVENT_BUFFER = 256
+    # Per-job deadline in seconds covering the local queue, the /prompt POST and the result wait
+    GENERATION_TIMEOUT = int(os.getenv("GENERATION_TIMEOUT", 600))
+    COMFY_RETRY_ATTEMPTS = 3
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 30
+    # A server is skipped for CIRCUIT_RESET_TIMEOUT seconds after this many failures in a row
+    CIRCUIT_FAILURE_THRESHOLD = 3
+    CIRCUIT_RESET_TIMEOUT = 30
+    # Input images uploaded through /upload/image land in input/<subfolder> on every server
+    COMFY_UPLOAD_SUBFOLDER = "boomio"
+    # Comma-separated host:port list of ComfyUI servers the scheduler balances over
+    COMFY_SERVERS = os.getenv("COMFY_SERVERS", SERVER_ADDRESS).split(",")
+    SCHEDULER_MAX_INFLIGHT_PER_SERVER = 2
+    SCHEDULER_POLL_INTERVAL = 5
+    # A server is marked unhealthy only after this many /queue polls in a row fail
+    SCHEDULER_UNHEALTHY_AFTER_POLLS = 3
+    # Queue-depth advantage granted to a server that already has the job's models loaded
+    SCHEDULER_AFFINITY_SLACK = 1
+    # Max consecutive same-model jobs a server may take ahead of an older job needing another model
+    SCHEDULER_MAX_AFFINITY_RUN = 8
+    MAX_BATCH_SIZE = 4
+    REGION_NAME = "eu-central-1"
+    TABLE_NAME = "avahi-boomio-img-prompt-registry"
+    BUCKET_NAME = "avahi-boomio"
+    S3_PREFIX = "avahi-boomio-genai-img"
+    S3_UPLOAD_WORKERS = 8
+    AWS_MAX_POOL_CONNECTIONS = 16
+    AWS_MAX_ATTEMPTS = 5
+    # Point at moto/LocalStack (e.g. http://localhost:4566) for local runs
+    AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL")
+    DYNAMO_BUFFER_MAX_ITEMS = 1000
+    DYNAMO_FLUSH_INTERVAL = 0.5
+    # Longest flush() waits for buffered prompt registry writes
+    DYNAMO_FLUSH_TIMEOUT = 60
+    DYNAMO_WRITE_ATTEMPTS = 5
+    BEDROCK_MODEL_ID = "eu.anthropic.claude-sonnet-4-20250514-v1:0"
+    CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+    BEDROCK_CACHE_TTL = 7 * 24 * 3600
+    BEDROCK_CACHE_MAX_ENTRIES = 64
+    BEDROCK_CACHE_MAX_DISK_BYTES = 64 * 1024 ** 2
+    # Deterministic mode keeps the workflow seed fixed so identical requests are
+    # served from the generation cache instead of the GPU.
+    GENERATION_DETERMINISTIC = os.getenv("GENERATION_DETERMINISTIC", "0") == "1"
+    GENERATION_CACHE_MAX_ENTRIES = 32
+    GENERATION_CACHE_MAX_MEMORY_BYTES = 256 * 1024 ** 2
+    GENERATION_CACHE_MAX_DISK_BYTES = 2 * 1024 ** 3
+    # Share the cache between app instances through S3 (expire it with a lifecycle rule).
+    GENERATION_CACHE_S3 = os.getenv("GENERATION_CACHE_S3", "0") == "1"
+    # Global budget for images kept between reruns by all sessions (see image_store.py)
+    IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", 256 * 1024 ** 2))
+    IMAGE_STORE_THUMBNAIL_SIDE = 384
+    # Recent spans kept for the JSON dump; TELEMETRY_DUMP_PATH (.json or .prom) dumps metrics at exit
+    TELEMETRY_MAX_SPANS = 1000
+    TELEMETRY_DUMP_PATH = os.getenv("TELEMETRY_DUMP_PATH")
+    BRANDBOOK_PREPROCESS = True
+    BRANDBOOK_MAX_PAGES = 12
+    BRANDBOOK_MAX_IMAGES = 8
+    BRANDBOOK_IMAGE_MAX_SIDE = 768
+    BRANDBOOK_MAX_TEXT_CHARS = 20000
+    # Below this much text on the selected pages the whole PDF is sent instead
+    BRANDBOOK_MIN_TEXT_CHARS = 200
     WORKFLOW_CHARACTER = "src/character-design-workflow.json"#os.getenv("TABLE_NAME")
     WORKFLOW_OBSTACLE = "src/obstacle-design-workflow.json"#os.getenv("TABLE_NAME")
-    WORKFLOW_BACKGROUND = "src/background-design-workflow.json"#os.getenv("TABLE_NAME")
\ No newline at end of file
+    WORKFLOW_BACKGROUND = "src/background-design-workflow.json"#os.getenv("TABLE_NAME")
+    # "batch" is False where the workflow merges its latent batch into a single
+    # output image. Patch targets are resolved by workflow_compiler.
+    ASSET_WORKFLOWS = {
+        "character": {"workflow": WORKFLOW_CHARACTER, "batch": True},
+        "obstacle": {"workflow": WORKFLOW_OBSTACLE, "batch": False},
+        "background": {"workflow": WORKFLOW_BACKGROUND, "batch": True},
+    }
+    # Give a template node one of these titles to make it the seed/prompt/latent patch target.
+    WORKFLOW_TARGET_TITLES = {"seed": "Seed", "prompt": "Prompt", "latent": "Latent"}
@@ -1,57 +1,195 @@
-import boto3
+import atexit
 import json
+import queue
+import threading
+import time
 from datetime import datetime
+from boto3.dynamodb.table import BatchWriter
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from src.code.aws_clients import get_client
+from src.code.config import Config
+from src.code.resilience import backoff_delay
+from src.code.telemetry import span
+
+# The shared low-level client takes DynamoDB-typed attribute values.
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def to_dynamo_item(record):
+    return {name: _serializer.serialize(value) for name, value in record.items()}
+
+
+def from_dynamo_item(item):
+    return {name: _deserializer.deserialize(value) for name, value in item.items()}
+
+
+class BufferedRecordWriter:
+    """Background writer that drains queued items into a table with BatchWriter.
+
+    Items are grouped into batches of up to 25 (the BatchWriteItem limit);
+    BatchWriter re-sends unprocessed items and failed batches are retried
+    with backoff. The queue is bounded, so producers block instead of growing
+    memory without limit, and pending items are flushed at interpreter exit.
+    If the writer thread dies, put() and flush() raise instead of blocking.
+    """
+
+    BATCH_SIZE = 25
+    _STOP = object()
 
-class DynamoAdapter:
     def __init__(self, logger, table_name):
+        self.logger = logger
+        self.table_name = table_name
+        self._queue = queue.Queue(maxsize=Config.DYNAMO_BUFFER_MAX_ITEMS)
+        # Set if _run dies; reported to producers instead of letting them block.
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f"dynamo-writer-{table_name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    def put(self, item):
+        # Block in slices so a dead writer is noticed once the queue is full.
+        while True:
+            self._check_alive()
+            try:
+                self._queue.put(item, timeout=Config.DYNAMO_FLUSH_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def flush(self, timeout=Config.DYNAMO_FLUSH_TIMEOUT):
+        """Wait until everything put so far is written (or dropped after retries)."""
+        deadline = time.monotonic() + timeout
+        flushed = threading.Event()
+        self.put(flushed)
+        while not flushed.wait(Config.DYNAMO_FLUSH_INTERVAL):
+            self._check_alive()
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Prompt registry writes to {self.table_name} not flushed after {timeout} s")
+
+    def close(self):
+        if self._thread.is_alive():
+            try:
+                self.put(self._STOP)
+            except RuntimeError:
+                return
+            self._thread.join()
+
+    def _check_alive(self):
+        if not self._thread.is_alive():
+            raise RuntimeError(f"Prompt registry writer for {self.table_name} has stopped") from self._error
+
+    def _run(self):
+        try:
+            client = get_client("dynamodb")
+            while True:
+                items = [self._queue.get()]
+                # A flush marker or _STOP ends the batch early.
+                while len(items) < self.BATCH_SIZE and isinstance(items[-1], dict):
+                    try:
+                        items.append(self._queue.get(timeout=Config.DYNAMO_FLUSH_INTERVAL))
+                    except queue.Empty:
+                        break
+                records = [item for item in items if isinstance(item, dict)]
+                if records:
+                    self._write(client, records)
+                for item in items:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    self._queue.task_done()
+                if items[-1] is self._STOP:
+                    return
+        except Exception as e:
+            self._error = e
+            self.logger.error(f"Error: prompt registry writer for {self.table_name} stopped: {e}")
+
+    def _write(self, client, records):
+        for attempt in range(1, Config.DYNAMO_WRITE_ATTEMPTS + 1):
+            try:
+                with span("dynamo.batch_write", items=len(records), attempt=attempt):
+                    with BatchWriter(self.table_name, client, flush_amount=self.BATCH_SIZE) as batch:
+                        for record in records:
+                            batch.put_item(Item=to_dynamo_item(record))
+                self.logger.debug(f"prompt registry batch saved: {len(records)} items")
+                return
+            except Exception as e:
+                self.logger.error(f"Error: {e} (attempt {attempt}/{Config.DYNAMO_WRITE_ATTEMPTS})")
+                time.sleep(backoff_delay(attempt, base=0.1, cap=5))
+        self.logger.error(f"Dropping {len(records)} prompt registry items after retries")
+
+
+class DynamoAdapter:
+    # One background writer per table, shared by every adapter instance.
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, logger, table_name, buffered=False):
         self.logger = logger
         self.dynamodb = self._build_dynamodb()
-        self.chat_table = self._get_table(table_name=table_name)
+        self.table_name = table_name
+        self.writer = self._get_writer(table_name) if buffered else None
+
+    @classmethod
+    def close_writers(cls):
+        """Flush and stop every background writer, e.g. before switching AWS endpoints."""
+        with cls._writers_lock:
+            writers = list(cls._writers.values())
+            cls._writers.clear()
+        for writer in writers:
+            writer.close()
+
+    def _get_writer(self, table_name):
+        with DynamoAdapter._writers_lock:
+            writer = DynamoAdapter._writers.get(table_name)
+            # Replace a writer whose thread died rather than failing every later put.
+            if writer is None or not writer.alive:
+                writer = BufferedRecordWriter(self.logger, table_name)
+                DynamoAdapter._writers[table_name] = writer
+            return writer
 
     def _build_dynamodb(self):
         self.logger.info("Inside DynamoAdapter._build_dynamodb()")
         try:
-            dynamodb = boto3.resource(
-                "dynamodb",
-                region_name='eu-central-1'
-            )
+            # The shared client is thread-safe; boto3 resources are not, and
+            # building one per Streamlit rerun thread would cost a new client.
+            dynamodb = get_client("dynamodb")
             return dynamodb
         except Exception as e:
             self.logger.error(f"Error: {e}")
 
-    def _get_table(self, table_name):
-        self.logger.info("Inside DynamoAdapter._get_table")
-        try:
-            table = self.dynamodb.Table(table_name)
-            self.chat_table = table
-            return table
-        except Exception as e:
-            self.logger.error(f"Error: {e}")
-
     def save_chat_history_record(self, bucket_id : str, prompt: str):
         self.logger.info("Inside DynamoAdapter.save_chat_history_record()")
         try:
             now = datetime.now()
-            response = self.chat_table.put_item(
-                Item={
-                    "bucket_id": bucket_id,
-                    "prompt": prompt,
-                    "timestamp": str(now)
-                }
-            )
-            self.logger.info(f"prompt registry saved: {response}")
+            item = {
+                "bucket_id": bucket_id,
+                "prompt": prompt,
+                "timestamp": str(now)
+            }
+            if self.writer:
+                self.writer.put(item)
+                return
+            with span("dynamo.put_item"):
+                response = self.dynamodb.put_item(TableName=self.table_name, Item=to_dynamo_item(item))
+            self.logger.debug(f"prompt registry saved: {response}")
         except Exception as e:
             self.logger.error(f"Error: {e}")
 
     def retrieve_chat_history_record(self, event_id: str):
         self.logger.info("Inside DynamoAdapter.retrieve_chat_history_record()")
         try:
-            response = self.chat_table.get_item(
-                Key={
+            response = self.dynamodb.get_item(
+                TableName=self.table_name,
+                Key=to_dynamo_item({
                     "event_id": event_id
-                }
+                })
             )
             self.logger.info(f"Chat history saved: {response}")
-            return json.dumps(response.get('Item'))
+            item = response.get('Item')
+            return json.dumps(from_dynamo_item(item) if item is not None else None)
         except Exception as e:
             self.logger.error(f"Error: {e}")
\ No newline at end of file
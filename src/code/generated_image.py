@@ -0,0 +1,62 @@
+import io
+from functools import cached_property
+from PIL import Image
+
+
+class MemoryviewReader(io.RawIOBase):
+    """Read-only, seekable file object over a buffer; reads copy only into the caller's buffer."""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+class GeneratedImage:
+    """An encoded image (PNG) exactly as ComfyUI sent it.
+
+    data is usually a memoryview into the websocket frame, so nothing is
+    copied until it is needed. open() feeds the original bytes to uploads
+    without a decode/re-encode round trip; pil decodes once, on first use,
+    for the tiler or anything else that needs pixels.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+    def __len__(self):
+        return self.data.nbytes
+
+    def open(self):
+        return io.BufferedReader(MemoryviewReader(self.data))
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+    @cached_property
+    def pil(self):
+        return Image.open(self.open())
@@ -0,0 +1,81 @@
+import json
+import logging
+import struct
+from botocore.exceptions import ClientError
+from src.code.aws_clients import get_client
+from src.code.config import Config
+from src.code.result_cache import ResultCache, cache_key
+
+logger = logging.getLogger(__name__)
+
+
+def workflow_hash(workflow):
+    """Hash of the fully patched workflow graph in canonical form (sorted keys, no whitespace)."""
+    return cache_key(json.dumps(workflow, sort_keys=True, separators=(",", ":"), ensure_ascii=False))
+
+
+def pack_images(images):
+    # 4-byte big-endian length before every encoded image.
+    return b"".join(struct.pack(">I", len(image)) + image for image in images)
+
+
+def unpack_images(blob):
+    images = []
+    offset = 0
+    while offset < len(blob):
+        (length,) = struct.unpack_from(">I", blob, offset)
+        offset += 4
+        images.append(blob[offset:offset + length])
+        offset += length
+    return images
+
+
+class GenerationCache:
+    """Encoded images of finished generations, keyed by workflow_hash.
+
+    The local tier is a ResultCache (size-bounded memory LRU and disk); with
+    Config.GENERATION_CACHE_S3 misses fall through to a shared S3 prefix. The
+    cache is best effort: S3 errors are logged and treated as misses.
+    """
+
+    def __init__(self):
+        self.local = ResultCache(
+            "generations",
+            max_entries=Config.GENERATION_CACHE_MAX_ENTRIES,
+            max_memory_bytes=Config.GENERATION_CACHE_MAX_MEMORY_BYTES,
+            max_disk_bytes=Config.GENERATION_CACHE_MAX_DISK_BYTES
+        )
+
+    def get(self, key):
+        blob = self.local.get(key)
+        if blob is None and Config.GENERATION_CACHE_S3:
+            blob = self._get_s3(key)
+            if blob is not None:
+                self.local.put(key, blob)
+        return None if blob is None else unpack_images(blob)
+
+    def put(self, key, images):
+        blob = pack_images(images)
+        self.local.put(key, blob)
+        if Config.GENERATION_CACHE_S3:
+            try:
+                get_client("s3").put_object(Bucket=Config.BUCKET_NAME, Key=self._s3_key(key), Body=blob)
+            except Exception as e:
+                logger.error(f"Error: could not store generation {key} in S3: {e}")
+
+    def _s3_key(self, key):
+        return f"{Config.S3_PREFIX}/cache/{key}"
+
+    def _get_s3(self, key):
+        try:
+            response = get_client("s3").get_object(Bucket=Config.BUCKET_NAME, Key=self._s3_key(key))
+            return response["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                logger.error(f"Error: could not read generation {key} from S3: {e}")
+        except Exception as e:
+            logger.error(f"Error: could not read generation {key} from S3: {e}")
+        return None
+
+
+generation_cache = GenerationCache()
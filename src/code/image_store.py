@@ -0,0 +1,130 @@
+import io
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from PIL import Image
+from src.code.aws_clients import get_client
+from src.code.config import Config
+from src.code.generated_image import GeneratedImage
+from src.code.telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+
+class _StoredImage:
+    def __init__(self, data, thumbnail, s3_uri):
+        self.data = data
+        self.thumbnail = thumbnail
+        self.s3_uri = s3_uri
+
+    @property
+    def nbytes(self):
+        return (len(self.data) if self.data is not None else 0) + len(self.thumbnail)
+
+
+class ImageStore:
+    """Process-wide store for the images shown by every Streamlit session.
+
+    Sessions keep only the string handles returned by put(). The store keeps
+    the encoded image and a small thumbnail per handle within a global budget
+    of Config.IMAGE_STORE_MAX_BYTES, evicting least-recently-used entries
+    first. Full-resolution bytes of images already in S3 are dropped before
+    anything else and fetched again on demand; the other entries are removed
+    entirely once the budget is exceeded, and get() then returns None.
+    """
+
+    def __init__(self, max_bytes=Config.IMAGE_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, image, s3_uri=None):
+        """Store an encoded image (bytes or GeneratedImage) and return its handle."""
+        # One copy out of the websocket frame, so get() can hand Streamlit plain bytes.
+        data = image.tobytes() if isinstance(image, GeneratedImage) else bytes(image)
+        entry = _StoredImage(data, self._make_thumbnail(data), s3_uri)
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._entries[handle] = entry
+            self._size += entry.nbytes
+            self._evict()
+        return handle
+
+    def attach_s3(self, handle, s3_uri):
+        """Record where an image was uploaded, making its full-resolution bytes evictable."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                entry.s3_uri = s3_uri
+                self._evict()
+
+    def get(self, handle):
+        """Full-resolution encoded bytes, downloaded again from S3 if they were evicted."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            data, s3_uri = entry.data, entry.s3_uri
+        if data is None:
+            data = self._download(s3_uri)
+            if data is None:
+                return None
+            with self._lock:
+                if self._entries.get(handle) is entry and entry.data is None:
+                    entry.data = data
+                    self._size += len(data)
+                    self._evict()
+        return data
+
+    def image(self, handle):
+        data = self.get(handle)
+        return GeneratedImage(data) if data is not None else None
+
+    def thumbnail(self, handle):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            return entry.thumbnail
+
+    @property
+    def size(self):
+        return self._size
+
+    @traced("image_store.thumbnail")
+    def _make_thumbnail(self, data):
+        image = Image.open(GeneratedImage(data).open())
+        image.thumbnail((Config.IMAGE_STORE_THUMBNAIL_SIDE, Config.IMAGE_STORE_THUMBNAIL_SIDE))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _evict(self):
+        # Called with _lock held.
+        for droppable in (lambda entry: entry.s3_uri is not None and entry.data is not None, lambda entry: True):
+            for handle, entry in list(self._entries.items()):
+                if self._size <= self.max_bytes:
+                    return
+                if not droppable(entry):
+                    continue
+                self._size -= entry.nbytes
+                if entry.s3_uri is not None and entry.data is not None:
+                    entry.data = None
+                    self._size += entry.nbytes
+                else:
+                    del self._entries[handle]
+
+    def _download(self, s3_uri):
+        bucket, _, key = s3_uri[len("s3://"):].partition("/")
+        try:
+            return get_client("s3").get_object(Bucket=bucket, Key=key)["Body"].read()
+        except Exception as e:
+            logger.error(f"Error: could not download {s3_uri}: {e}")
+            return None
+
+
+image_store = ImageStore()
@@ -0,0 +1,139 @@
+import ast
+import json
+
+WHITESPACE = " \t\r\n"
+# Characters tolerated before the opening brace: whitespace and a ```json fence.
+PREAMBLE = WHITESPACE + "`json"
+
+
+def _literal(raw):
+    try:
+        return json.loads(raw, strict=False)
+    except ValueError:
+        pass
+    try:
+        # Bedrock sometimes answers with a Python-style dict (single quotes).
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Malformed value in model output: {raw[:80]}")
+
+
+class IncrementalDictParser:
+    """Incremental parser for a single top-level JSON (or Python literal) object.
+
+    feed() accepts text chunks as they stream in and returns the (key, value)
+    pairs whose value completed within that chunk, so callers can act on each
+    field before the whole completion has arrived. Anything that cannot start
+    or continue an object raises ValueError immediately.
+    """
+
+    def __init__(self):
+        self.result = {}
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self._expect = None
+        self._token_start = None
+        self._key = None
+
+    def feed(self, chunk):
+        self._text += chunk
+        completed = []
+        while self._pos < len(self._text):
+            self._step(self._text[self._pos], completed)
+            self._pos += 1
+        return completed
+
+    def close(self):
+        if not self.done:
+            raise ValueError("Model output ended before the JSON object was complete")
+        return self.result
+
+    def _emit(self, raw, completed):
+        value = _literal(raw)
+        self.result[self._key] = value
+        completed.append((self._key, value))
+        self._expect = "comma"
+
+    def _step(self, ch, completed):
+        if self.done:
+            if ch not in WHITESPACE + "`":
+                raise ValueError("Unexpected content after the JSON object")
+            return
+        if not self._started:
+            if ch == "{":
+                self._started = True
+                self._depth = 1
+                self._expect = "key"
+            elif ch not in PREAMBLE:
+                raise ValueError(f"Model output does not start with a JSON object: {self._text[:80]!r}")
+            return
+
+        if self._quote:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == self._quote:
+                self._quote = None
+                if self._depth == 1:
+                    raw = self._text[self._token_start:self._pos + 1]
+                    if self._expect == "key":
+                        self._key = _literal(raw)
+                        self._expect = "colon"
+                    else:
+                        self._emit(raw, completed)
+            return
+
+        if self._depth > 1:
+            if ch in "\"'":
+                self._quote = ch
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(self._text[self._token_start:self._pos + 1], completed)
+            return
+
+        if self._expect == "scalar":
+            if ch not in ",}":
+                return
+            self._emit(self._text[self._token_start:self._pos].strip(), completed)
+        if ch in WHITESPACE:
+            return
+        if self._expect == "key":
+            if ch in "\"'":
+                self._quote = ch
+                self._token_start = self._pos
+            elif ch == "}":
+                self._finish()
+            else:
+                raise ValueError(f"Expected a key in model output, got {ch!r}")
+        elif self._expect == "colon":
+            if ch != ":":
+                raise ValueError(f"Expected ':' in model output, got {ch!r}")
+            self._expect = "value"
+        elif self._expect == "value":
+            self._token_start = self._pos
+            if ch in "\"'":
+                self._quote = ch
+            elif ch in "{[":
+                self._depth += 1
+            else:
+                self._expect = "scalar"
+        elif self._expect == "comma":
+            if ch == ",":
+                self._expect = "key"
+            elif ch == "}":
+                self._finish()
+            else:
+                raise ValueError(f"Expected ',' or '}}' in model output, got {ch!r}")
+
+    def _finish(self):
+        self._depth = 0
+        self.done = True
@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+import urllib.error
+from src.code.config import Config
+
+
+class ServerUnavailableError(RuntimeError):
+    """Raised instead of queueing when no ComfyUI server can take work."""
+
+
+class SubmissionUnknownError(RuntimeError):
+    """A request was sent but no response came back, so the server may have acted on it."""
+
+
+def backoff_delay(attempt, base=Config.RETRY_BASE_DELAY, cap=Config.RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    # Resending a prompt the server may already have queued would run it twice.
+    if isinstance(error, SubmissionUnknownError):
+        return False
+    # 4xx from /prompt means the workflow was rejected; sending it again will not help.
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (urllib.error.URLError, ConnectionError, TimeoutError, OSError))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and allow()
+    returns False for reset_timeout seconds. Then it is half-open: calls are
+    allowed again, the next success closes it and the next failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD, reset_timeout=Config.CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Count a failure; returns True if this opened the circuit."""
+        with self._lock:
+            state = self._state()
+            self._failures += 1
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                return True
+            return False
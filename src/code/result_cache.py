@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from src.code.config import Config
+
+
+def cache_key(*parts):
+    """Stable sha256 over the given str/bytes parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for encoded results: in-process LRU plus a local disk tier.
+
+    Entries expire after ttl seconds (None keeps them forever). The memory
+    tier holds at most max_entries values and, with max_memory_bytes, at most
+    that many bytes of them; the disk tier is trimmed oldest
+    first once it grows beyond max_disk_bytes, and expired files are swept
+    on every write rather than only when they are read again. The cache
+    directory is created on the first put.
+    """
+
+    def __init__(self, name, ttl=None, max_entries=128, max_disk_bytes=None, max_memory_bytes=None):
+        self.directory = os.path.join(Config.CACHE_DIR, name)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._directory_ready = False
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or now - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                self._forget(key)
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self.ttl is not None and now - stored_at >= self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as file:
+                value = file.read()
+            if self.ttl is None:
+                # mtime only drives trimming then; touching makes it least-recently-used.
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._remember(key, value, stored_at)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value, time.time())
+        # Write to a temp file and rename so readers never see partial entries.
+        if not self._directory_ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._directory_ready = True
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(value)
+        os.replace(tmp_path, path)
+        if self.ttl is not None or self.max_disk_bytes is not None:
+            self._trim_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _remember(self, key, value, stored_at):
+        if self.max_memory_bytes is not None and len(value) > self.max_memory_bytes:
+            # Would evict everything else and still not fit; the disk tier keeps it.
+            return
+        with self._lock:
+            if key in self._memory:
+                self._forget(key)
+            self._memory[key] = (stored_at, value)
+            self._memory_bytes += len(value)
+            while len(self._memory) > self.max_entries or (
+                self.max_memory_bytes is not None and self._memory_bytes > self.max_memory_bytes
+            ):
+                self._forget(next(iter(self._memory)))
+
+    def _forget(self, key):
+        # Called with _lock held.
+        _, value = self._memory.pop(key)
+        self._memory_bytes -= len(value)
+
+    def _trim_disk(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                if self.ttl is not None and now - stat.st_mtime >= self.ttl:
+                    self._remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        if self.max_disk_bytes is None:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,87 @@
+import io
+import logging
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.code.aws_clients import get_client
+from src.code.config import Config
+from src.code.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_object_id():
+    # ULID: 48-bit millisecond timestamp + 80 random bits, Crockford base32.
+    # Keys sort by creation time like the old sequence numbers, but need no
+    # bucket listing and cannot collide between concurrent uploads.
+    value = (int(time.time() * 1000) << 80) | secrets.randbits(80)
+    chars = []
+    for _ in range(26):
+        chars.append(CROCKFORD_BASE32[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _remaining_bytes(file):
+    position = file.tell()
+    size = file.seek(0, io.SEEK_END) - position
+    file.seek(position)
+    return size
+
+
+def upload_objects(objects, progress_callback=None):
+    """Upload (s3_key, source) pairs concurrently over a bounded thread pool.
+
+    source is a local path or a readable binary file object. progress_callback,
+    if given, is called as progress_callback(s3_key, uploaded, total) on the
+    calling thread after each object finishes, so it may update Streamlit.
+    """
+    s3 = get_client("s3")
+
+    def upload(s3_key, source):
+        with span("s3.upload", key=s3_key) as current:
+            if isinstance(source, str):
+                current.add_bytes(os.path.getsize(source), "out")
+                s3.upload_file(source, Config.BUCKET_NAME, s3_key)
+            else:
+                current.add_bytes(_remaining_bytes(source), "out")
+                s3.upload_fileobj(source, Config.BUCKET_NAME, s3_key)
+        return s3_key
+
+    with ThreadPoolExecutor(max_workers=Config.S3_UPLOAD_WORKERS) as executor:
+        futures = [executor.submit(upload, s3_key, source) for s3_key, source in objects]
+        for uploaded, future in enumerate(as_completed(futures), start=1):
+            s3_key = future.result()
+            logger.debug(f"Uploaded s3://{Config.BUCKET_NAME}/{s3_key}")
+            if progress_callback:
+                progress_callback(s3_key, uploaded, len(futures))
+
+
+def save_img_s3_buffer(prefix, buffer):
+    s3 = get_client("s3")
+    s3_key = f"{Config.S3_PREFIX}/{prefix}/{prefix}_{new_object_id()}.png"
+
+    logger.debug(f"Uploading {s3_key} -> s3://{Config.BUCKET_NAME}/{s3_key}")
+    with span("s3.upload", key=s3_key) as current:
+        current.add_bytes(_remaining_bytes(buffer), "out")
+        # Upload the BytesIO object to S3
+        s3.upload_fileobj(
+            buffer,
+            Config.BUCKET_NAME,
+            s3_key
+        )
+    s3_key_final = f"s3://{Config.BUCKET_NAME}/{s3_key}"
+    return s3_key_final
+
+
+def save_img_s3_tiles(prefix, tiles, progress_callback=None):
+    # tiles: (tile_name, encoded_bytes) pairs as produced by split_image_into_tiles
+    folder = f"{Config.S3_PREFIX}/{prefix}/background_{new_object_id()}"
+    # BytesIO over an existing bytes object shares its buffer until written to.
+    objects = [(f"{folder}/{tile_name}", io.BytesIO(data)) for tile_name, data in tiles]
+    upload_objects(objects, progress_callback)
+    s3_key_folder = f"s3://{Config.BUCKET_NAME}/{folder}"
+    return s3_key_folder
@@ -0,0 +1,370 @@
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.code.comfy_client import ComfyClient
+from src.code.config import Config
+from src.code.resilience import CircuitBreaker, ServerUnavailableError, SubmissionUnknownError, backoff_delay, is_retryable
+from src.code.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_LOADER_CLASSES = ("CheckpointLoaderSimple", "UNETLoader", "DualCLIPLoader", "VAELoader")
+
+
+class Priority:
+    # Lower runs first.
+    INTERACTIVE = 0
+    BULK = 10
+
+
+def model_key(workflow):
+    """Hashable description of the models a workflow loads (checkpoint, UNET, CLIP, VAE)."""
+    loaders = []
+    for node in workflow.values():
+        if node.get("class_type") in MODEL_LOADER_CLASSES:
+            inputs = node.get("inputs", {})
+            loaders.append((node["class_type"],) + tuple(sorted(
+                (name, value) for name, value in inputs.items() if isinstance(value, str)
+            )))
+    return tuple(sorted(loaders))
+
+
+class ScheduledJob:
+    def __init__(self, workflow, priority, deadline=None):
+        self.workflow = workflow
+        self.priority = priority
+        self.model_key = model_key(workflow)
+        self.server_address = None
+        self.prompt_id = None
+        self.submitted_at = time.monotonic()
+        # time.monotonic() value after which the job is dropped or cancelled
+        self.deadline = deadline
+        self.attempts = 0
+        # Retries wait in the queue until this time.
+        self.not_before = 0
+        # Resolves to the /prompt response once the job is sent to a server.
+        self.dispatched = Future()
+        # Resolves to the encoded image frames once the server finishes.
+        self.images = Future()
+
+    def wait_dispatched(self, timeout=None):
+        return self.dispatched.result(timeout)
+
+    def result(self, timeout=None):
+        return self.images.result(timeout)
+
+    def expired(self, now):
+        return self.deadline is not None and now >= self.deadline
+
+    def fail(self, error):
+        for future in (self.dispatched, self.images):
+            if not future.done():
+                future.set_exception(error)
+
+
+class ComfyServer:
+    def __init__(self, address):
+        self.address = address
+        self.healthy = True
+        self.failed_polls = 0
+        self.remote_depth = 0
+        self.inflight = 0
+        self.loaded_model_key = None
+        # Consecutive jobs dispatched with loaded_model_key
+        self.run_length = 0
+        self.breaker = CircuitBreaker()
+        # /prompt POSTs; one worker per slot, so a hanging server only stalls its own jobs.
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.SCHEDULER_MAX_INFLIGHT_PER_SERVER,
+            thread_name_prefix=f"comfy-dispatch-{address}"
+        )
+
+    @property
+    def available(self):
+        return self.healthy and self.breaker.allow()
+
+    @property
+    def load(self):
+        # Our own in-flight jobs are part of the remote queue once it is polled again.
+        return max(self.remote_depth, self.inflight)
+
+
+class JobScheduler:
+    """Priority queue in front of /prompt that balances jobs over a pool of ComfyUI servers.
+
+    Jobs leave the local queue only when a healthy server with a connected
+    websocket has a free slot (Config.SCHEDULER_MAX_INFLIGHT_PER_SERVER), and
+    are POSTed by that server's own workers, so interactive jobs overtake
+    queued bulk work instead of landing behind it on the GPU. Among free
+    servers the least-loaded one wins, preferring servers that already have
+    the job's models loaded (see _select). Queue depth and health come from
+    polling /queue.
+
+    Jobs carry a deadline: past it they are dropped from the local queue or
+    cancelled on their server. Failed /prompt POSTs are retried with jittered
+    backoff unless the server may already have queued the prompt, and each server has a circuit breaker, so a dead server is
+    skipped and submit() fails fast when none is available.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, server_addresses):
+        self.servers = [ComfyServer(address) for address in server_addresses]
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        # prompt_id -> (job, server, result future) for jobs running on a server
+        self._inflight = {}
+        for server in self.servers:
+            # Open the websockets early so results are never missed.
+            ComfyClient.for_server(server.address).add_connect_listener(self._wake)
+        threading.Thread(target=self._dispatch_loop, name="comfy-scheduler", daemon=True).start()
+        threading.Thread(target=self._poll_loop, name="comfy-scheduler-poll", daemon=True).start()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(Config.COMFY_SERVERS)
+            return cls._instance
+
+    def submit(self, workflow, priority=Priority.INTERACTIVE, deadline=None):
+        if not any(server.available for server in self.servers):
+            raise ServerUnavailableError("No ComfyUI server is available right now; please try again shortly.")
+        job = ScheduledJob(workflow, priority, deadline)
+        self._push(job)
+        return job
+
+    def _push(self, job):
+        with self._condition:
+            heapq.heappush(self._heap, (job.priority, next(self._counter), job))
+            self._condition.notify_all()
+
+    def cancel(self, job, error=None):
+        """Drop a queued job, or interrupt it on its server if already dispatched."""
+        error = error or RuntimeError("Generation cancelled")
+        with self._condition:
+            queued = any(entry[2] is job for entry in self._heap)
+            if queued:
+                self._heap = [entry for entry in self._heap if entry[2] is not job]
+                heapq.heapify(self._heap)
+            inflight = self._inflight.pop(job.prompt_id, None) if job.prompt_id else None
+        if inflight:
+            _, server, future = inflight
+            self._abort(ComfyClient.for_server(server.address), job.prompt_id, future, server)
+        job.fail(error)
+
+    def _abort(self, client, prompt_id, future, server):
+        try:
+            client.cancel(prompt_id)
+        except Exception as e:
+            logger.error(f"Error: could not cancel {prompt_id} on {server.address}: {e}")
+        future.cancel()
+        self._release(server)
+
+    def cancel_prompt(self, prompt_id):
+        """cancel() by prompt_id; returns False if the scheduler does not know the prompt."""
+        with self._condition:
+            inflight = self._inflight.get(prompt_id)
+        if inflight is None:
+            return False
+        self.cancel(inflight[0])
+        return True
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    # --- Server selection ---
+    def _free_servers(self):
+        # Without a websocket the results would be lost, and an idle-looking
+        # disconnected server would otherwise attract every job.
+        return [
+            server for server in self.servers
+            if server.available and server.inflight < Config.SCHEDULER_MAX_INFLIGHT_PER_SERVER
+            and ComfyClient.for_server(server.address).connected
+        ]
+
+    def _select(self):
+        """Pick the next (job, server) pair, or None if nothing can run now.
+
+        Model swaps cost a multi-GB reload, so pending jobs are grouped by
+        model_key: a server keeps draining jobs of the models it has loaded,
+        skipping over the head of the queue for at most
+        Config.SCHEDULER_MAX_AFFINITY_RUN consecutive jobs. Jobs of a higher
+        priority class are never skipped.
+        """
+        free = self._free_servers()
+        now = time.monotonic()
+        ready = [entry for entry in self._heap if entry[2].not_before <= now]
+        if not ready or not free:
+            return None
+        top_priority, _, head = min(ready)
+        min_load = min(server.load for server in free)
+
+        # 1. A free server that already has the head job's models loaded.
+        warm = [server for server in free if server.loaded_model_key == head.model_key]
+        warm = [server for server in warm if server.load <= min_load + Config.SCHEDULER_AFFINITY_SLACK]
+        if warm:
+            return head, min(warm, key=lambda server: server.load)
+
+        # 2. Let a warm server continue its model run with a same-priority job.
+        for server in sorted(free, key=lambda server: server.load):
+            if server.loaded_model_key is None or server.run_length >= Config.SCHEDULER_MAX_AFFINITY_RUN:
+                continue
+            same_model = [
+                entry for entry in ready
+                if entry[0] == top_priority and entry[2].model_key == server.loaded_model_key
+            ]
+            if same_model:
+                return min(same_model)[2], server
+
+        # 3. Otherwise the least-loaded server swaps to the head job's models.
+        return head, min(free, key=lambda server: server.load)
+
+    def _next_assignment(self):
+        with self._condition:
+            while True:
+                self._drop_expired()
+                selection = self._select()
+                if selection:
+                    job, server = selection
+                    self._heap = [entry for entry in self._heap if entry[2] is not job]
+                    heapq.heapify(self._heap)
+                    server.inflight += 1
+                    if server.loaded_model_key == job.model_key:
+                        server.run_length += 1
+                    else:
+                        server.loaded_model_key = job.model_key
+                        server.run_length = 1
+                    return job, server
+                # Wake up for retries whose backoff has passed.
+                now = time.monotonic()
+                self._condition.wait(min(
+                    [Config.SCHEDULER_POLL_INTERVAL] + [entry[2].not_before - now for entry in self._heap if entry[2].not_before > now]
+                ))
+
+    def _drop_expired(self):
+        # Called with _condition held.
+        if self._heap and not any(server.available for server in self.servers):
+            # Fail fast rather than letting every queued job run into its deadline.
+            for _, _, job in self._heap:
+                job.fail(ServerUnavailableError("No ComfyUI server is available right now; please try again shortly."))
+            self._heap = []
+            return
+        now = time.monotonic()
+        expired = [entry[2] for entry in self._heap if entry[2].expired(now)]
+        if expired:
+            self._heap = [entry for entry in self._heap if not entry[2].expired(now)]
+            heapq.heapify(self._heap)
+            for job in expired:
+                job.fail(TimeoutError("Timed out waiting for a free ComfyUI server"))
+
+    # --- Dispatch ---
+    def _dispatch_loop(self):
+        while True:
+            job, server = self._next_assignment()
+            metrics.observe("scheduler_queue_wait_seconds", time.monotonic() - job.submitted_at, priority=job.priority)
+            server.executor.submit(self._send, job, server)
+
+    def _send(self, job, server):
+        # Runs on the server's executor; inflight already holds a slot for the job.
+        client = ComfyClient.for_server(server.address)
+        try:
+            if not client.connected:
+                raise ConnectionError(f"No websocket connection to {server.address}")
+            response = client.queue_prompt(job.workflow)
+            prompt_id = response["prompt_id"]
+        except Exception as e:
+            self._release(server)
+            self._dispatch_failed(job, server, e)
+            return
+        server.breaker.record_success()
+        job.server_address = server.address
+        job.prompt_id = prompt_id
+        future = client.result_future(prompt_id)
+        with self._condition:
+            # cancel() may have failed the job while it was being sent.
+            cancelled = job.dispatched.done()
+            if not cancelled:
+                self._inflight[prompt_id] = (job, server, future)
+        if cancelled:
+            self._abort(client, prompt_id, future, server)
+            return
+        job.dispatched.set_result(response)
+        future.add_done_callback(lambda future, job=job, server=server: self._complete(job, server, future))
+
+    def _dispatch_failed(self, job, server, error):
+        if job.dispatched.done():
+            return
+        if is_retryable(error) or isinstance(error, SubmissionUnknownError):
+            if server.breaker.record_failure():
+                logger.error(f"Error: circuit opened for ComfyUI server {server.address}: {error}")
+        if is_retryable(error):
+            job.attempts += 1
+            if job.attempts < Config.COMFY_RETRY_ATTEMPTS and not job.expired(time.monotonic()):
+                job.not_before = time.monotonic() + backoff_delay(job.attempts)
+                self._push(job)
+                return
+        job.fail(error)
+
+    def _complete(self, job, server, future):
+        with self._condition:
+            # Jobs cancelled or expired have already released their slot.
+            if self._inflight.pop(job.prompt_id, None) is None:
+                return
+        self._release(server)
+        if future.cancelled():
+            job.fail(RuntimeError("Generation cancelled"))
+        elif future.exception():
+            if isinstance(future.exception(), ConnectionError):
+                server.breaker.record_failure()
+            job.fail(future.exception())
+        else:
+            job.images.set_result(future.result())
+
+    def _release(self, server):
+        with self._condition:
+            server.inflight -= 1
+            self._condition.notify_all()
+
+    # --- Health and queue depth ---
+    def _poll_loop(self):
+        while True:
+            for server in self.servers:
+                self._poll(server)
+            self._expire_inflight()
+            with self._condition:
+                self._condition.notify_all()
+            time.sleep(Config.SCHEDULER_POLL_INTERVAL)
+
+    def _expire_inflight(self):
+        now = time.monotonic()
+        with self._condition:
+            expired = [entry for entry in self._inflight.values() if entry[0].expired(now)]
+        for job, server, _ in expired:
+            # A slow prompt is not a server fault; the breaker only counts failed submissions and results.
+            logger.error(f"Error: prompt {job.prompt_id} on {server.address} passed its deadline, cancelling")
+            self.cancel(job, TimeoutError("Generation did not finish before its deadline"))
+
+    def _poll(self, server):
+        try:
+            with urllib.request.urlopen(f"http://{server.address}/queue", timeout=Config.HTTP_TIMEOUT) as response:
+                queue = json.loads(response.read())
+            server.remote_depth = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+            if not server.healthy:
+                logger.info(f"ComfyUI server {server.address} is healthy again")
+            server.healthy = True
+            server.failed_polls = 0
+        except Exception as e:
+            server.failed_polls += 1
+            # One dropped poll must not mark the server down and flush the local queue.
+            if server.healthy and server.failed_polls >= Config.SCHEDULER_UNHEALTHY_AFTER_POLLS:
+                logger.error(f"Error: ComfyUI server {server.address} unhealthy: {e}")
+                server.healthy = False
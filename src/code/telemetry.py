@@ -0,0 +1,199 @@
+"""Lightweight spans and metrics for the generation pipeline.
+
+    with span("s3.upload", prefix=prefix) as current:
+        ...
+        current.add_bytes(size, "out")
+
+Every span feeds the stage_duration_seconds histogram (labelled by stage and
+status) and is kept in a bounded list of recent spans. Bytes and other
+measurements go to counters and histograms in the same registry, which can
+be dumped as JSON or Prometheus text (metrics.dump(path), or set
+TELEMETRY_DUMP_PATH to dump at exit). When the optional opentelemetry package
+is installed, every span is also started on an OpenTelemetry tracer, so any
+configured OTel SDK exporter receives them.
+"""
+import atexit
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from src.code.config import Config
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    def __init__(self, max_spans=Config.TELEMETRY_MAX_SPANS):
+        self._histograms = {}
+        self._counters = {}
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_span(self, record):
+        with self._lock:
+            self._spans.append(record)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._spans.clear()
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "histograms": [
+                    {
+                        "name": name, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                        "buckets": {str(bound): count for bound, count in histogram.cumulative()}
+                    }
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ],
+                "spans": list(self._spans),
+            }
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write Prometheus text for *.prom paths, JSON otherwise."""
+        with open(path, "w") as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), file, indent=2)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+metrics = MetricsRegistry()
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.otel_span = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, value)
+
+    def add_bytes(self, nbytes, direction):
+        """Count bytes moved by this stage ("in" or "out")."""
+        self.set(f"bytes_{direction}", self.attributes.get(f"bytes_{direction}", 0) + nbytes)
+        metrics.increment("stage_bytes_total", nbytes, stage=self.name, direction=direction)
+
+
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    status = "ok"
+    started_at = time.time()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        if otel_trace is not None:
+            current.otel_span = stack.enter_context(
+                otel_trace.get_tracer(__name__).start_as_current_span(name, attributes=attributes)
+            )
+        try:
+            yield current
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            metrics.observe("stage_duration_seconds", duration, stage=name, status=status)
+            metrics.add_span({
+                "name": name, "trace_id": current.trace_id, "span_id": current.span_id,
+                "parent_id": current.parent_id, "start": started_at, "duration": duration,
+                "status": status, "attributes": current.attributes
+            })
+
+
+def current_span():
+    return _current_span.get()
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if Config.TELEMETRY_DUMP_PATH:
+    atexit.register(metrics.dump, Config.TELEMETRY_DUMP_PATH)
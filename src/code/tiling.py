@@ -0,0 +1,32 @@
+import io
+from src.code.telemetry import traced
+
+
+@traced("tiling.split")
+def split_image_into_tiles(img, rows, cols, image_format="JPEG"):
+    """Crop a decoded PIL image into rows x cols tiles encoded in memory.
+
+    Returns a row-major list of (tile_name, encoded_bytes). Working on the
+    decoded image avoids a PNG round-trip, and the tiles never touch disk, so
+    concurrent sessions cannot clobber each other's files.
+    """
+    if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img_width, img_height = img.size
+    tile_width = img_width // cols
+    tile_height = img_height // rows
+    extension = "jpg" if image_format == "JPEG" else image_format.lower()
+
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            left = c * tile_width
+            upper = r * tile_height
+            right = left + tile_width
+            lower = upper + tile_height
+
+            # Crop the tile and encode it straight into a buffer
+            buffer = io.BytesIO()
+            img.crop((left, upper, right, lower)).save(buffer, format=image_format)
+            tiles.append((f"tile_r{r}_c{c}.{extension}", buffer.getvalue()))
+    return tiles
@@ -0,0 +1,71 @@
+import streamlit as st
+from src.code.image_store import image_store
+from src.code.workflow import Workflow
+
+
+def progress_renderer():
+    """on_event callback for Workflow.get_images that renders live progress and previews."""
+    status = st.empty()
+    bar = st.progress(0.0)
+    preview = st.empty()
+
+    def on_event(event):
+        if event["type"] == "progress" and event["max"]:
+            bar.progress(event["value"] / event["max"], text=f"Step {event['value']}/{event['max']} (node {event['node']})")
+        elif event["type"] == "executing":
+            status.caption(f"Running node {event['node']}")
+        elif event["type"] == "execution_cached":
+            status.caption(f"Reusing {len(event['nodes'])} cached nodes")
+        elif event["type"] == "preview":
+            preview.image(bytes(event["image"]), caption="Preview", width=256)
+        elif event["type"] in ("done", "error"):
+            bar.empty()
+            preview.empty()
+
+    return on_event
+
+
+def handle_cancel(key, pending_key):
+    """Cancel the generation stored as (server, prompt_id) in session_state[pending_key].
+
+    The "Cancel generation" button (widget key) is shown while waiting on an
+    image. Clicking it reruns the page, which abandons the wait; call this
+    early in the rerun so the prompt is cancelled on the ComfyUI server too.
+    """
+    pending = st.session_state.get(pending_key)
+    if st.session_state.get(key) and pending:
+        Workflow.cancel_prompt(*pending)
+        st.session_state[pending_key] = None
+        st.warning("Generation cancelled.")
+
+
+def show_stored_images(handles, caption, full_key):
+    """Render image_store handles as thumbnails, or at full resolution when the checkbox is ticked."""
+    full = st.checkbox("Show full resolution", key=full_key)
+    images, captions = [], []
+    for index, handle in enumerate(handles, start=1):
+        data = image_store.get(handle) if full else image_store.thumbnail(handle)
+        if data is not None:
+            images.append(data)
+            captions.append(f"{caption} {index}" if len(handles) > 1 else caption)
+    if images:
+        st.image(images, caption=captions)
+    if len(images) < len(handles):
+        st.caption("Some images are no longer in memory; generate them again to see them.")
+
+
+def show_stored_image(handle, caption):
+    """Render an image_store handle as its thumbnail; the full image is fetched only when downloaded.
+
+    Calling get() on every rerun would re-download evicted images from S3
+    each time, only for them to be evicted again.
+    """
+    thumbnail = image_store.thumbnail(handle)
+    if thumbnail is None:
+        st.caption(f"{caption} is no longer in memory; generate it again to see it.")
+        return
+    st.image(thumbnail, caption=caption)
+    st.download_button(
+        "Download", data=lambda: image_store.get(handle) or b"", file_name=f"{caption}.png", mime="image/png",
+        key=f"download {caption} {handle}", on_click="ignore"
+    )
@@ -1,47 +1,165 @@
-import streamlit as st
 import json
+import os
+import queue
+import threading
+import time
 import urllib.request
 import urllib.parse
 import base64
-import websocket
-import io
+import concurrent.futures
 import random
-from PIL import Image
 from src.code.config import Config
+from src.code.comfy_client import ComfyClient
+from src.code.generated_image import GeneratedImage
+from src.code.generation_cache import generation_cache, workflow_hash
+from src.code.resilience import ServerUnavailableError
+from src.code.scheduler import JobScheduler, Priority
+from src.code.telemetry import current_span, metrics, traced
+from src.code.workflow_compiler import compile_workflow
 
 class Workflow:
+    # Parsed workflow templates shared by every session: filename -> (mtime, graph).
+    # Templates are never mutated; patches replace the touched node instead.
+    _templates = {}
+    # Compiled (pruned and indexed) templates: filename -> (mtime, CompiledWorkflow)
+    _compiled = {}
+    _templates_lock = threading.Lock()
 
-    def __init__(self):
-        # Instance attributes (unique to each instance)
-        pass
+    def __init__(self, logger=None, priority=Priority.INTERACTIVE, deterministic=Config.GENERATION_DETERMINISTIC,
+                 timeout=Config.GENERATION_TIMEOUT):
+        # Without a logger, messages go to the Streamlit page as before;
+        # headless callers pass a logger and never import Streamlit.
+        self.logger = logger
+        self.priority = priority
+        # Deterministic mode keeps template seeds, so an identical request
+        # hashes to the same workflow and is served from generation_cache.
+        self.deterministic = deterministic
+        # Seconds from queue_prompt until the images must have arrived.
+        self.timeout = timeout
+        # prompt_id -> ScheduledJob for prompts queued through the scheduler
+        self._jobs = {}
+        # prompt_id -> workflow hash to store the result under once it arrives
+        self._cache_keys = {}
+        # synthetic prompt_id -> cached images, for cache hits
+        self._cached = {}
+
+    def _notify(self, level, message):
+        if self.logger:
+            getattr(self.logger, "info" if level == "success" else level)(message)
+        else:
+            import streamlit as st
+            getattr(st, level)(message)
 
     # --- Functions from your code ---
     def load_workflow(self, filename):
+        template = self._load_template(filename)
+        # Copy-on-write: the request gets its own node map, nodes stay shared until patched.
+        return dict(template[1]) if template is not None else None
+
+    @traced("workflow.load")
+    def _load_template(self, filename):
+        # (mtime, graph) of the cached template version; None once the error is reported.
         try:
-            with open(filename, 'r') as file:
-                return json.load(file)
+            mtime = os.path.getmtime(filename)
+            with Workflow._templates_lock:
+                template = Workflow._templates.get(filename)
+                if template is None or template[0] != mtime:
+                    with open(filename, 'r') as file:
+                        template = (mtime, json.load(file))
+                    Workflow._templates[filename] = template
+            return template
         except FileNotFoundError:
-            st.error(f"Error: Workflow file '{filename}' not found.")
+            self._notify("error", f"Error: Workflow file '{filename}' not found.")
             return None
         except json.JSONDecodeError:
-            st.error(f"Error: Failed to decode JSON from '{filename}'.")
+            self._notify("error", f"Error: Failed to decode JSON from '{filename}'.")
             return None
 
+    def load_compiled(self, filename):
+        """Pruned copy of a template plus its patch targets ({} if it cannot be loaded).
+
+        Compilation runs once per template version; see workflow_compiler.
+        """
+        template = self._load_template(filename)
+        if template is None:
+            return None, {}
+        # The mtime and graph come from the same template version, even if the file changes meanwhile.
+        mtime, workflow = template
+        with Workflow._templates_lock:
+            compiled = Workflow._compiled.get(filename)
+            if compiled is None or compiled[0] != mtime:
+                compiled = (mtime, compile_workflow(workflow))
+                Workflow._compiled[filename] = compiled
+        return dict(compiled[1].graph), compiled[1].targets
+
+    def build_asset_workflow(self, asset_type, prompt, variants=1, variant=0):
+        """Load the compiled workflow for one asset type from Config.ASSET_WORKFLOWS and patch it.
+
+        variant numbers repeated calls for non-batched workflows so deterministic
+        mode still gives each one its own seed.
+        """
+        asset = Config.ASSET_WORKFLOWS[asset_type]
+        workflow, targets = self.load_compiled(asset["workflow"])
+        workflow = self.update_workflow_with_rdn_seed(workflow, targets.get("seed"), offset=variant)
+        workflow = self.update_workflow_with_prompt(workflow, prompt, targets.get("prompt"))
+        if asset["batch"]:
+            workflow = self.update_workflow_with_batch(workflow, variants, targets.get("latent"))
+        return workflow
+
+    @traced("workflow.generate_asset")
+    def generate_asset(self, asset_type, prompt, variants=1):
+        """Queue one asset type and wait for its GeneratedImages; raises RuntimeError on failure."""
+        # Batch-capable workflows produce every variant from one queued prompt.
+        batched = Config.ASSET_WORKFLOWS[asset_type]["batch"]
+        images = []
+        for variant in range(1 if batched else variants):
+            workflow = self.build_asset_workflow(asset_type, prompt, variants, variant)
+            if not workflow:
+                raise RuntimeError(f"Failed to build the {asset_type} workflow")
+            response = self.queue_prompt(workflow)
+            if not response or not response.get("prompt_id"):
+                raise RuntimeError("Failed to get prompt ID from the server response")
+            images.extend(self.get_images(response["prompt_id"]))
+        if not images:
+            raise RuntimeError("ComfyUI returned no images")
+        return images
+
+    def _patch_input(self, workflow, node_number, name, value):
+        node = workflow[node_number]
+        workflow[node_number] = {**node, "inputs": {**node["inputs"], name: value}}
+        return workflow
+
     def encode_image_to_base64(self, image_bytes):
         return base64.b64encode(image_bytes).decode('utf-8')
 
     def update_workflow_with_image(self, workflow, image_bytes, node_number):
         if workflow is None:
             return None
-        base64_image = self.encode_image_to_base64(image_bytes)
         # The node ID '10' is hardcoded from your example.
         # It might be different in a user's workflow.
         if node_number in workflow and "inputs" in workflow[node_number]:
-            workflow[node_number]["inputs"]["image"] = base64_image
+            try:
+                name = self.upload_image(image_bytes)
+            except Exception as e:
+                # Fall back to inlining the image in the prompt JSON.
+                self._notify("warning", f"Image upload failed, sending it inline: {e}")
+                return self._patch_input(workflow, node_number, "image", self.encode_image_to_base64(image_bytes))
+            # LoadImage has the same (IMAGE, MASK) outputs as ETN_LoadImageBase64.
+            workflow[node_number] = {**workflow[node_number], "class_type": "LoadImage", "inputs": {"image": name}}
             return workflow
         else:
-            st.error("Error: Workflow structure is missing image node or 'input'.")
+            self._notify("error", "Error: Workflow structure is missing image node or 'input'.")
             return None
+
+    def upload_image(self, image_bytes):
+        # The scheduler decides the server only at dispatch, so the image must be
+        # on every server it may pick; each client uploads a given image once.
+        # Unavailable servers are skipped rather than waited on.
+        servers = [server.address for server in JobScheduler.get().servers if server.available]
+        if not servers:
+            raise ServerUnavailableError("No ComfyUI server is available right now; please try again shortly.")
+        names = {ComfyClient.for_server(server).upload_image(image_bytes) for server in servers}
+        return names.pop()
     
     def update_workflow_with_prompt(self, workflow, prompt, node_number):
         if workflow is None:
@@ -49,57 +167,126 @@ class Workflow:
         # The node ID '10' is hardcoded from your example.
         # It might be different in a user's workflow.
         if node_number in workflow and "inputs" in workflow[node_number]:
-            workflow[node_number]["inputs"]["text"] = prompt
-            return workflow
+            return self._patch_input(workflow, node_number, "text", prompt)
         else:
-            st.error("Error: Workflow structure is missing prompt node or 'inputs'.")
+            self._notify("error", "Error: Workflow structure is missing prompt node or 'inputs'.")
             return None
 
-    def queue_prompt(self, prompt):
-        data = json.dumps({"prompt": prompt}).encode('utf-8')
-        req = urllib.request.Request(f"http://{Config.SERVER_ADDRESS}/prompt", data=data, headers={"Content-Type": "application/json"})
+    @traced("workflow.queue_prompt")
+    def queue_prompt(self, prompt, priority=None):
+        cache_key = None
+        if self.deterministic:
+            cache_key = workflow_hash(prompt)
+            images = generation_cache.get(cache_key)
+            metrics.increment("generation_cache_requests_total", result="miss" if images is None else "hit")
+            if images is not None:
+                # Nothing is sent to ComfyUI; fetch_images returns the cached frames.
+                prompt_id = f"cache-{cache_key}"
+                self._cached[prompt_id] = images
+                self._notify("info", "Identical generation found in the cache.")
+                return {"prompt_id": prompt_id, "cached": True}
+        deadline = time.monotonic() + self.timeout
         try:
-            with urllib.request.urlopen(req) as response:
-                return json.loads(response.read())
+            # The scheduler picks the server and holds the job until one has capacity.
+            job = JobScheduler.get().submit(prompt, self.priority if priority is None else priority, deadline)
+            response = job.wait_dispatched(max(deadline - time.monotonic(), 0))
+            self._jobs[response["prompt_id"]] = job
+            if cache_key:
+                self._cache_keys[response["prompt_id"]] = cache_key
+            return response
         except urllib.error.HTTPError as e:
-            st.error(f"HTTP Error: {e.code}: {e.reason}")
-            st.error(f"Response body: {e.read().decode('utf-8')}")
+            self._notify("error", f"HTTP Error: {e.code}: {e.reason}")
+            self._notify("error", f"Response body: {e.read().decode('utf-8')}")
+            return None
+        except concurrent.futures.TimeoutError:
+            JobScheduler.get().cancel(job, TimeoutError("Timed out waiting for a free ComfyUI server"))
+            self._notify("error", f"Error: no ComfyUI server accepted the prompt within {self.timeout}s.")
             return None
         except Exception as e:
-            st.error(f"An error occurred while queuing the prompt: {e}")
+            self._notify("error", f"An error occurred while queuing the prompt: {e}")
             return None
 
-    def get_image(self, prompt_id):
+    def server_for(self, prompt_id):
+        job = self._jobs.get(prompt_id)
+        return job.server_address if job else Config.SERVER_ADDRESS
+
+    @staticmethod
+    def cancel_prompt(server_address, prompt_id):
+        # Stops the GPU work; the waiting fetch_images call then fails with an interruption.
+        if not JobScheduler.get().cancel_prompt(prompt_id):
+            ComfyClient.for_server(server_address).cancel(prompt_id)
+
+    @traced("workflow.wait_images")
+    def fetch_images(self, prompt_id, on_event=None):
+        # Encoded (PNG) frames as sent by the server; batched prompts send one per variant.
+        # on_event receives progress/executing/execution_cached/preview events while waiting.
+        if prompt_id in self._cached:
+            return self._cached.pop(prompt_id)
         try:
-            ws = websocket.WebSocket()
-            ws.connect(f"ws://{Config.SERVER_ADDRESS}/ws")
-            st.info(f"Waiting for image data for prompt ID: {prompt_id}")
-
-            while True:
-                message = ws.recv()
-                if isinstance(message, str):
-                    data = json.loads(message)
-                    if data["type"] == "executing" and data["data"]["node"] is None and data["data"]["prompt_id"] == prompt_id:
-                        st.success("Execution completed.")
-                        break
-                elif isinstance(message, bytes):
-                    # We expect the first binary message to be the image.
-                    ws.close()
-                    return Image.open(io.BytesIO(message[8:]))
-            ws.close()
-            return None
+            self._notify("info", f"Waiting for image data for prompt ID: {prompt_id}")
+            client = ComfyClient.for_server(self.server_for(prompt_id))
+            job = self._jobs.pop(prompt_id, None)
+            future = job.images if job else client.result_future(prompt_id)
+            deadline = job.deadline if job else time.monotonic() + self.timeout
+            if on_event:
+                events = client.events(prompt_id)
+                while not (future.done() and events.empty()) and time.monotonic() < deadline:
+                    try:
+                        on_event(events.get(timeout=0.2))
+                    except queue.Empty:
+                        pass
+            try:
+                images = future.result(max(deadline - time.monotonic(), 0))
+            except concurrent.futures.TimeoutError:
+                # Free the GPU instead of leaving the prompt running for nobody.
+                if job:
+                    JobScheduler.get().cancel(job, TimeoutError("Generation did not finish before its deadline"))
+                else:
+                    future.cancel()
+                    client.cancel(prompt_id)
+                raise TimeoutError(f"no image within {self.timeout}s; the prompt was cancelled")
+            current_span().add_bytes(sum(len(image) for image in images), "in")
+            self._notify("success", "Execution completed.")
+            cache_key = self._cache_keys.pop(prompt_id, None)
+            if cache_key and images:
+                generation_cache.put(cache_key, images)
+            return images
         except Exception as e:
-            st.error(f"An error occurred while retrieving the image: {e}")
+            self._notify("error", f"An error occurred while retrieving the image: {e}")
+            return []
+
+    def get_images(self, prompt_id, on_event=None):
+        # Kept encoded; GeneratedImage.pil decodes only when pixels are needed.
+        return [GeneratedImage(image) for image in self.fetch_images(prompt_id, on_event)]
+
+    def get_image(self, prompt_id, on_event=None):
+        images = self.get_images(prompt_id, on_event)
+        # We expect the first binary message to be the image.
+        return images[0] if images else None
+
+    def update_workflow_with_batch(self, workflow, batch_size, node_number):
+        if workflow is None:
+            return None
+        # ComfyUI draws distinct noise for every latent of the batch from the
+        # sampler seed, so one queued prompt yields batch_size variants.
+        if node_number in workflow and "inputs" in workflow[node_number]:
+            return self._patch_input(workflow, node_number, "batch_size", int(batch_size))
+        else:
+            self._notify("error", "Error: Workflow structure is missing latent node or 'inputs'.")
             return None
             
-    def update_workflow_with_rdn_seed(self, workflow, node_number):
+    def update_workflow_with_rdn_seed(self, workflow, node_number, offset=0):
         if workflow is None:
             return None
-        random_seed = random.randint(4294967294, 742213406368043)
         # The node ID '3' is hardcoded from your example.
         if node_number in workflow and "inputs" in workflow[node_number]:
-            workflow[node_number]["inputs"]["seed"] = random_seed
-            return workflow
+            if self.deterministic:
+                # Keep the template seed so the same request hashes the same.
+                if not offset:
+                    return workflow
+                return self._patch_input(workflow, node_number, "seed", workflow[node_number]["inputs"]["seed"] + offset)
+            random_seed = random.randint(4294967294, 742213406368043)
+            return self._patch_input(workflow, node_number, "seed", random_seed)
         else:
-            st.error("Error: Workflow structure is missing seed node or 'inputs'.")
+            self._notify("error", "Error: Workflow structure is missing seed node or 'inputs'.")
             return None
\ No newline at end of file
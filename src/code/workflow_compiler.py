@@ -0,0 +1,118 @@
+from collections import defaultdict
+from src.code.comfy_client import OUTPUT_NODE_CLASSES
+from src.code.config import Config
+
+SAMPLER_CLASSES = ("KSampler", "KSamplerAdvanced")
+LATENT_CLASSES = ("EmptyLatentImage", "EmptySD3LatentImage")
+TEXT_ENCODER_CLASSES = ("CLIPTextEncode",)
+
+
+class CompiledWorkflow:
+    """A template reduced to what its output nodes need, plus the node IDs to patch.
+
+    targets maps "seed", "prompt" and "latent" to node IDs (missing if the
+    template has no such node). graph is shared by every request; copy it
+    (Workflow.load_compiled does) before patching.
+    """
+
+    def __init__(self, graph, targets, output_nodes):
+        self.graph = graph
+        self.targets = targets
+        self.output_nodes = output_nodes
+
+
+def _links(node):
+    # Inputs wired to another node are [node_id, output_index] pairs.
+    return [value[0] for value in node.get("inputs", {}).values() if isinstance(value, list) and len(value) == 2]
+
+
+def build_index(graph):
+    index = {"class_type": defaultdict(list), "title": defaultdict(list)}
+    for node_id, node in graph.items():
+        index["class_type"][node.get("class_type")].append(node_id)
+        title = node.get("_meta", {}).get("title")
+        if title:
+            index["title"][title].append(node_id)
+    return index
+
+
+def reachable_nodes(graph, output_nodes):
+    """IDs of output_nodes and every node they depend on."""
+    seen = set()
+    stack = list(output_nodes)
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen or node_id not in graph:
+            continue
+        seen.add(node_id)
+        stack.extend(_links(graph[node_id]))
+    return seen
+
+
+def _upstream(graph, node_id, classes):
+    # Breadth-first from node_id's inputs to the nearest node of one of classes.
+    queue = [node_id]
+    seen = set()
+    while queue:
+        current = queue.pop(0)
+        if current in seen or current not in graph:
+            continue
+        seen.add(current)
+        if current != node_id and graph[current].get("class_type") in classes:
+            return current
+        queue.extend(_links(graph[current]))
+    return None
+
+
+def resolve_targets(graph, index):
+    """Find the seed, prompt and latent nodes of a txt2img template.
+
+    A node titled as in Config.WORKFLOW_TARGET_TITLES wins. Otherwise the
+    sampler fed by an empty latent (the txt2img stage, not a refiner or
+    Kontext edit) supplies the seed, its latent_image the latent size and the
+    nearest text encoder on its positive input the prompt.
+    """
+    targets = {}
+    sampler = None
+    for node_id in sorted(sum((index["class_type"][cls] for cls in SAMPLER_CLASSES), []), key=_node_order):
+        latent = graph[node_id]["inputs"].get("latent_image")
+        if isinstance(latent, list) and graph.get(latent[0], {}).get("class_type") in LATENT_CLASSES:
+            sampler = node_id
+            break
+    if sampler is not None:
+        inputs = graph[sampler]["inputs"]
+        targets["seed"] = sampler
+        targets["latent"] = inputs["latent_image"][0]
+        if isinstance(inputs.get("positive"), list):
+            positive = inputs["positive"][0]
+            if graph.get(positive, {}).get("class_type") in TEXT_ENCODER_CLASSES:
+                targets["prompt"] = positive
+            else:
+                prompt = _upstream(graph, positive, TEXT_ENCODER_CLASSES)
+                if prompt is not None:
+                    targets["prompt"] = prompt
+    for role, title in Config.WORKFLOW_TARGET_TITLES.items():
+        titled = index["title"].get(title, [])
+        if len(titled) == 1:
+            targets[role] = titled[0]
+    return targets
+
+
+def _node_order(node_id):
+    return (0, int(node_id)) if node_id.isdigit() else (1, node_id)
+
+
+def compile_workflow(graph):
+    """Prune a template to the nodes its websocket outputs depend on and index its patch targets.
+
+    Preview-only branches (PreviewImage and the decodes feeding just them) are
+    dropped, so the server neither runs nor stores them. Templates without a
+    websocket output node are kept whole.
+    """
+    index = build_index(graph)
+    output_nodes = sum((index["class_type"][cls] for cls in OUTPUT_NODE_CLASSES), [])
+    if output_nodes:
+        keep = reachable_nodes(graph, output_nodes)
+        graph = {node_id: node for node_id, node in graph.items() if node_id in keep}
+        index = build_index(graph)
+    return CompiledWorkflow(graph, resolve_targets(graph, index), output_nodes)
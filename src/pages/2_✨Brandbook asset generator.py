@@ -1,82 +1,27 @@
 import streamlit as st
-import io
-import os
-import boto3
-import ast
 import json
-import re
 import random
 import base64
-from PIL import Image
 from src.code.workflow import Workflow
 from src.code.config import Config
 from src.code.dynamo_adapter import DynamoAdapter
+from src.code.bedrock_pipeline import recommendation_pipeline_stream
+from src.code.s3_adapter import save_img_s3_buffer, save_img_s3_tiles
+from src.code.tiling import split_image_into_tiles
+from src.code.asset_set import generate_asset_set
+from src.code.image_store import image_store
+from src.code.ui_helpers import progress_renderer, handle_cancel, show_stored_images, show_stored_image
 import logging
 
 
-TABLE_NAME = 'avahi-boomio-img-prompt-registry'
+TABLE_NAME = Config.TABLE_NAME
+# Bedrock JSON keys -> prompt text areas
+PROMPT_AREAS = {
+    "Character prompt": "area_1",
+    "Obstacles prompt": "area_2",
+    "Background prompt": "area_3"
+}
 logger = logging.getLogger(__name__)
-# --- Configuration ---
-def recommendation_pipeline(document_bytes_1):
-    # Create a Bedrock Runtime client in the AWS Region you want to use.
-    
-    if not document_bytes_1:
-        return ""
-    else:
-        try:
-            logger.info("Initiate bedrock client")
-            bedrock_runtime = boto3.client("bedrock-runtime", region_name="eu-central-1")
-            json_schema={
-                "Character prompt" : "(JSON string)",
-                "Obstacles prompt:" : "(JSON string)",
-                "Background prompt:" : "(JSON string)"
-            }
-            conversation= [
-                {
-                    "role": "user",
-                    "content": [
-                        {"text": "Base on the brand book information provided, generate a single, compact and detail prompt for image generating characters, obstacles and background for a one-tapping game. \n"
-                         "**Character prompt:**"
-                        "Create the character using as guide the following prompt: Pixel art a detailed, full-body, character of a cute and cheerful brown cat name Katty. Katty is wearing a vibrant blue retro witch dress and hat. Cute and smiling face. The art style is crisp and clean, with a simple color palette that highlights the character's features. Add running cycle pose on mid air. \n"
-                        "**Obstacles prompt:**"
-                        "Create the obstacles using as guide the following prompt: Vertical obstacles shaped like magical crystal spires for a fantasy mobile game. Tall, jagged crystalline columns glowing in bright colors (blue, purple, pink), semi-transparent with shiny facets. Stylized, clean, playful design with glowing edges and magical aura. Vector-like style, smooth and iconic, suitable for 2D game assets. White or transparent background. High resolution."
-                        "**Background prompt:**"
-                        "Create the background using as guide the following prompt: A 2D rendered game scene, 16-bit retro pixel art, retro video game, flappy bird-like style. Bright colorful sky with a magical gradient (purple, pink, and turquoise). Floating glowing clouds and sparkles in the air. Mystical floating islands and crystal mountains in the distance. Flatten, runnable ground area made of enchanted grass with glowing flowers and mushrooms. Playful, vibrant, whimsical style with smooth vector-like shading, clean and iconic, suitable for 2D mobile game assets. "
-                        "Provided results as a json with any aditional details, just the json format output \n"
-                        "Provide results with the follow schema:"
-                        f"{json_schema}"},
-                        {
-                            "document": {
-                                # Available formats: html, md, pdf, doc/docx, xls/xlsx, csv, and txt
-                                "format": "pdf",
-                                "name": "asset-related",
-                                "source": {"bytes": document_bytes_1},
-                                        }
-                                        },
-                    ],
-                }
-            ]
-
-
-            # Get Bedrock response
-            logger.info("Initiate bedrock response")
-            response = bedrock_runtime.converse(
-                modelId="eu.anthropic.claude-sonnet-4-20250514-v1:0",
-                messages=conversation,
-                inferenceConfig={"maxTokens": 2048, "temperature": 0.3},
-            )
-            # Decode the response body.
-            # Extract and print the response text.
-            logger.info("Cleaning bedrock response")
-            response_output = response["output"]["message"]["content"][0]["text"]
-
-            clean_output = re.sub(r"```json|```", "", response_output).strip()
-            data_dict = ast.literal_eval(clean_output)
-            #parsed_json_output = json.dumps(clean_output)
-            return data_dict
-        except Exception as e:
-            logger.error(f"Error during KB + Bedrock integration: {str(e)}")
-
 # --- App Configuration and Title ---
 st.set_page_config(
     page_title="Boomio brandbook game assets generator",
@@ -89,11 +34,14 @@ with spc_2:
 
 st.title("✨ Boomio brandbook game assets generator")
 st.sidebar.header("Assest generator (Bedrock + ComfyUI)")
+deterministic = st.sidebar.checkbox(
+    "Deterministic seeds (reuse identical generations)", value=Config.GENERATION_DETERMINISTIC
+)
 st.markdown("##### This platform allows you to: \n" \
 "- Generate individual game assets (characters, obstacles, backgrounds) based on upload brandbook information and pre-processing.")
 st.markdown("##### Guidelines:")
 st.markdown("1. Upload brand book pdf to extract information using AWS Bedrock and automatically generate prompts for each asset by clicking **Generate Prompt**")
-st.markdown("2. Click the **Generate Image** button to create the asset.")
+st.markdown("2. Click the **Generate Image** button to create the asset, or **Generate full asset set** to render all three at once.")
 st.markdown("3. Repeat the process for each game asset, or create new ones by following the same steps.")
 
 col_aux1, col_aux2 = st.columns([1, 1])
@@ -121,86 +69,6 @@ if 'bkg_img_3' not in st.session_state:
 if 'bkg_img_4' not in st.session_state:
     st.session_state.bkg_img_4 = []
 
-def save_img_s3_buffer(prefix, buffer):
-    # Initialize S3 client
-    s3 = boto3.client("s3", region_name="eu-central-1")
-    # Regex to extract sequence numbers (e.g. image_001.png → 1)
-    pattern = re.compile(rf"{prefix}_(\d+)\.\w+$")
-    # 1. Get existing objects in the bucket
-    existing_objects = s3.list_objects_v2(Bucket="avahi-boomio", Prefix=f"avahi-boomio-genai-img/{prefix}")
-    last_number = 0
-    if existing_objects["KeyCount"]==0:
-        last_number=0
-    else:
-        last_number=existing_objects["KeyCount"]
-    s3_key = f"avahi-boomio-genai-img/{prefix}/{prefix}_{last_number}.png"  # e.g. image_004.png
-
-    print(f"Uploading {s3_key} -> s3://avahi-boomio/avahi-boomio-genai-img/{prefix}/{s3_key}")
-    # Upload the BytesIO object to S3
-    s3.upload_fileobj(
-        buffer,
-        "avahi-boomio",
-        s3_key
-    )
-    s3_key_final = f"s3://avahi-boomio/avahi-boomio-genai-img/{prefix}/{s3_key}"
-    return s3_key_final
-
-
-def save_img_s3_file(prefix, path):
-    # Initialize S3 client
-    s3 = boto3.client("s3", region_name="eu-central-1")
-    local_folder = path
-    ## Check number of folder in s3 prefix
-    response = s3.list_objects_v2(
-        Bucket="avahi-boomio",
-        Prefix="avahi-boomio-genai-img/background/",
-        Delimiter="/"   # treat "/" as folder separator
-    )
-
-    folders = []
-    if "CommonPrefixes" in response:
-        folders = [prefix["Prefix"] for prefix in response["CommonPrefixes"]]
-    seq_num=len(folders)
-
-
-    # Walk through all files in the folder (recursively)
-    for root, dirs, files in os.walk(local_folder):
-        for filename in files:
-            if filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff")):
-                local_path = os.path.join(root, filename)
-                #s3://avahi-boomio/avahi-boomio-genai-img/background/
-                # Keep folder structure in S3
-                relative_path = os.path.relpath(local_path, local_folder)
-                s3_key=f"avahi-boomio-genai-img/{prefix}/background_{seq_num}/{relative_path}"
-                print(f"Uploading {local_path} -> s3://avahi-boomio/avahi-boomio-genai-img/{prefix}/background_{seq_num}/{relative_path}")
-                s3.upload_file(local_path, "avahi-boomio", s3_key)
-    s3_key_folder=f"s3://avahi-boomio/avahi-boomio-genai-img/{prefix}/background_{seq_num}"
-    return s3_key_folder
-
-
-def split_image_into_tiles(image_path, output_dir, rows, cols):
-    img = Image.open(image_path)
-    img_width, img_height = img.size
-    tile_width = img_width // cols
-    tile_height = img_height // rows
-
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    for r in range(rows):
-        for c in range(cols):
-            left = c * tile_width
-            upper = r * tile_height
-            right = left + tile_width
-            lower = upper + tile_height
-
-            # Crop the tile
-            tile = img.crop((left, upper, right, lower))
-
-            # Save the tile
-            tile_name = f"tile_r{r}_c{c}.jpg"
-            tile.save(os.path.join(output_dir, tile_name))
-
 with st.container():
     with col_aux1:
         uploaded_file = st.file_uploader('Choose your .pdf file', type="pdf", key="pdf file")
@@ -213,12 +81,39 @@ with st.container():
             # Read the file content as bytes
             with st.spinner("Processing..."):
                 bytes_data = uploaded_file.read()
-                output_text=recommendation_pipeline(bytes_data)
+                prompt_placeholders = {area: st.empty() for area in PROMPT_AREAS.values()}
+
+                def show_prompt(key, value):
+                    # Fill each text area as soon as its prompt is complete in the stream
+                    area = PROMPT_AREAS.get(key.rstrip(":").strip())
+                    if area:
+                        st.session_state[area] = value
+                        prompt_placeholders[area].success(f"**{key.rstrip(':')}:** {value}")
+
+                output_text=recommendation_pipeline_stream(bytes_data, on_prompt=show_prompt)
                 if output_text:
                     prompt_character=st.text_area("Output Results:", value=output_text, height=200, key="area_4")
-                    st.session_state.area_1=output_text["Character prompt"]
-                    st.session_state.area_2=output_text["Obstacles prompt"]
-                    st.session_state.area_3=output_text["Background prompt"]
+                else:
+                    st.error("Bedrock did not return valid prompts for this brandbook.")
+
+        if st.button("Generate full asset set", key="button_all"):
+            # Character, obstacle and background render concurrently; each section
+            # below shows its result from session_state as soon as it is collected.
+            prompts = {
+                asset_type: st.session_state[area]
+                for asset_type, area in (("character", "area_1"), ("obstacle", "area_2"), ("background", "area_3"))
+                if st.session_state.get(area)
+            }
+            variants = {"character": st.session_state.get("variants_1", 1), "background": st.session_state.get("variants_3", 1)}
+            status = {asset_type: st.empty() for asset_type in prompts}
+            for asset_type in prompts:
+                status[asset_type].info(f"Generating {asset_type}...")
+            for asset_type, handles in generate_asset_set(prompts, variants, deterministic):
+                if handles:
+                    st.session_state[f"generated_image_{asset_type}"] = handles
+                    status[asset_type].success(f"{asset_type.capitalize()} ready.")
+                else:
+                    status[asset_type].error(f"Failed to generate the {asset_type}.")
             
 
 
@@ -237,6 +132,9 @@ with st.container():
             placeholder="Pixel art a detailed, full-body, character of a cute and cheerful brown sloth name sloth. The sloth is wearing a vibrant blue superhero cape and a white headband with red and blue stripes. The art style is crisp and clean, with a simple color palette that highlights the character's features. Add flapping cycle pose on mid air. "
             , key="area_1"
         )
+        variants_character = st.number_input(
+            "Number of variants:", min_value=1, max_value=Config.MAX_BATCH_SIZE, value=1, key="variants_1"
+        )
 
 
     # --- Generated Image Output Section (on the right) ---
@@ -246,44 +144,44 @@ with st.container():
         # This is a placeholder for where you would add your generation logic.
         with st.spinner("Generating..."):
             st.success("Image generation process would start now!")
+        handle_cancel("cancel_1", "pending_character")
         if st.button("Generate Image", key="button_1"):
                 # Load the workflow
-                wrk = Workflow()
-                workflow = wrk.load_workflow(Config.WORKFLOW_CHARACTER)
-                
-                if workflow:
-                    with st.spinner("Processing..."):
-                        # Update the workflow with a random seed
-                        workflow = wrk.update_workflow_with_rdn_seed(workflow, "7")
-
-                        # Update the workflow with a new prompt
-                        workflow = wrk.update_workflow_with_prompt(workflow, prompt_character, "5")
-
-                        if workflow:
-                            # Queue the prompt
-                            response = wrk.queue_prompt(workflow)
-
-                            if response:
-                                prompt_id = response.get('prompt_id')
-                                if prompt_id:
-                                    st.info("Prompt queued. Waiting for image generation...")
-                                    
-                                    # Get the generated image
-                                    generated_image = wrk.get_image(prompt_id)
-                                    buffer = io.BytesIO()
-                                    generated_image.save(buffer, format='PNG') # Save the image to the buffer
-                                    buffer.seek(0) 
-                                    img_char_s3_key=save_img_s3_buffer("character", buffer)
-                                    dyna = DynamoAdapter(logger, TABLE_NAME)
+                wrk = Workflow(deterministic=deterministic)
+                with st.spinner("Processing..."):
+                    # Compiled template with a random seed, the prompt and the variant count
+                    workflow = wrk.build_asset_workflow("character", prompt_character, variants_character)
+
+                    if workflow:
+                        # Queue the prompt
+                        response = wrk.queue_prompt(workflow)
+
+                        if response:
+                            prompt_id = response.get('prompt_id')
+                            if prompt_id:
+                                st.info("Prompt queued. Waiting for image generation...")
+                                
+                                # Get the generated image
+                                st.session_state.pending_character = (wrk.server_for(prompt_id), prompt_id)
+                                st.button("Cancel generation", key="cancel_1")
+                                generated_images = wrk.get_images(prompt_id, on_event=progress_renderer())
+                                st.session_state.pending_character = None
+                                dyna = DynamoAdapter(logger, TABLE_NAME, buffered=True)
+                                handles = []
+                                for generated_image in generated_images:
+                                    # Upload the PNG exactly as ComfyUI encoded it
+                                    img_char_s3_key=save_img_s3_buffer("character", generated_image.open())
                                     dyna.save_chat_history_record(img_char_s3_key, prompt_character)
-                                    st.session_state.generated_image_character=generated_image
-                                else:
-                                    st.error("Failed to get prompt ID from the server response.")
-                        else:
-                            st.error("Failed to update the workflow. Please check your workflow file.")
+                                    handles.append(image_store.put(generated_image, img_char_s3_key))
+                                # Sessions keep handles; the pixels live in the shared, bounded image_store
+                                st.session_state.generated_image_character=handles
+                            else:
+                                st.error("Failed to get prompt ID from the server response.")
+                    else:
+                        st.error("Failed to update the workflow. Please check your workflow file.")
         #st.subheader("Character Generated Images:")
         if st.session_state.generated_image_character:
-            st.image(st.session_state.generated_image_character, caption="Generated character")
+            show_stored_images(st.session_state.generated_image_character, "Generated character", "full_1")
 
 with st.container():
     # --- User Input Section (on the left) ---
@@ -307,43 +205,42 @@ with st.container():
         # This is a placeholder for where you would add your generation logic.
         with st.spinner("Generating..."):
             st.success("Image generation process would start now!")
+        handle_cancel("cancel_2", "pending_obstacle")
         if st.button("Generate Image", key="button_2"):
                 # Load the workflow
-                wrk = Workflow()
-                workflow_obstacle = wrk.load_workflow(Config.WORKFLOW_OBSTACLE)
-                
-                if workflow_obstacle:
-                    with st.spinner("Processing..."):
-                        # Update the workflow with a random seed
-                        workflow_obstacle = wrk.update_workflow_with_rdn_seed(workflow_obstacle, "2")
-
-                        # Update the workflow with a new prompt
-                        workflow_obstacle = wrk.update_workflow_with_prompt(workflow_obstacle, prompt_obstacles, "3")
-
-                        if workflow_obstacle:
-                            # Queue the prompt
-                            obstacle_response = wrk.queue_prompt(workflow_obstacle)
-
-                            if obstacle_response:
-                                prompt_id_obstacles = obstacle_response.get('prompt_id')
-                                if prompt_id_obstacles:
-                                    st.info("Prompt queued. Waiting for image generation...")
-                                    
-                                    # Get the generated image
-                                    generated_image_obstacles = wrk.get_image(prompt_id_obstacles)
-                                    buffer = io.BytesIO()
-                                    generated_image_obstacles.save(buffer, format='PNG') # Save the image to the buffer
-                                    buffer.seek(0) 
-                                    img_obst_s3_key=save_img_s3_buffer("obstacle", buffer)
-                                    dyna = DynamoAdapter(logger, TABLE_NAME)
-                                    dyna.save_chat_history_record(img_obst_s3_key, prompt_obstacles) 
-                                    st.session_state.generated_image_obstacle=generated_image_obstacles
+                wrk = Workflow(deterministic=deterministic)
+                with st.spinner("Processing..."):
+                    # Compiled template with a random seed, the prompt and the variant count
+                    workflow_obstacle = wrk.build_asset_workflow("obstacle", prompt_obstacles)
+
+                    if workflow_obstacle:
+                        # Queue the prompt
+                        obstacle_response = wrk.queue_prompt(workflow_obstacle)
+
+                        if obstacle_response:
+                            prompt_id_obstacles = obstacle_response.get('prompt_id')
+                            if prompt_id_obstacles:
+                                st.info("Prompt queued. Waiting for image generation...")
+                                
+                                # Get the generated image
+                                st.session_state.pending_obstacle = (wrk.server_for(prompt_id_obstacles), prompt_id_obstacles)
+                                st.button("Cancel generation", key="cancel_2")
+                                generated_image_obstacles = wrk.get_image(prompt_id_obstacles, on_event=progress_renderer())
+                                st.session_state.pending_obstacle = None
+                                if generated_image_obstacles is None:
+                                    st.error("The server returned no obstacle image. Please try again.")
                                 else:
-                                    st.error("Failed to get prompt ID from the server response.")
-                        else:
-                            st.error("Failed to update the workflow. Please check your workflow file.")
+                                    # Upload the PNG exactly as ComfyUI encoded it
+                                    img_obst_s3_key=save_img_s3_buffer("obstacle", generated_image_obstacles.open())
+                                    dyna = DynamoAdapter(logger, TABLE_NAME, buffered=True)
+                                    dyna.save_chat_history_record(img_obst_s3_key, prompt_obstacles) 
+                                    st.session_state.generated_image_obstacle=[image_store.put(generated_image_obstacles, img_obst_s3_key)]
+                            else:
+                                st.error("Failed to get prompt ID from the server response.")
+                    else:
+                        st.error("Failed to update the workflow. Please check your workflow file.")
         if st.session_state.generated_image_obstacle:
-            st.image(st.session_state.generated_image_obstacle, caption="Generated obstacle")
+            show_stored_images(st.session_state.generated_image_obstacle, "Generated obstacle", "full_2")
 
 with st.container():
     # --- User Input Section (on the left) ---
@@ -358,6 +255,9 @@ with st.container():
             placeholder="A 2D rendered game scene, 16-bit retro pixel art, retro video game, flappy bird-like style. Bright colorful sky with a magical gradient (purple, pink, and turquoise). Floating glowing clouds and sparkles in the air. Mystical floating islands and crystal mountains in the distance. Flatten, runnable ground area made of enchanted grass with glowing flowers and mushrooms. Playful, vibrant, whimsical style with smooth vector-like shading, clean and iconic, suitable for 2D mobile game assets. ",
             key="area_3"
         )
+        variants_background = st.number_input(
+            "Number of variants:", min_value=1, max_value=Config.MAX_BATCH_SIZE, value=1, key="variants_3"
+        )
 
 
     # --- Generated Image Output Section (on the right) ---
@@ -367,37 +267,35 @@ with st.container():
         # This is a placeholder for where you would add your generation logic.
         with st.spinner("Generating..."):
             st.success("Image generation process would start now!")
+        handle_cancel("cancel_3", "pending_background")
         if st.button("Generate Image", key="button_3"):
                 # Load the workflow
-                wrk = Workflow()
-                workflow_background = wrk.load_workflow(Config.WORKFLOW_BACKGROUND)
-                
-                if workflow_background:
-                    with st.spinner("Processing..."):
-                        # Update the workflow with a random seed
-                        workflow_background = wrk.update_workflow_with_rdn_seed(workflow_background, "5")
-
-                        # Update the workflow with a new prompt
-                        workflow_background = wrk.update_workflow_with_prompt(workflow_background, prompt_background, "3")
-
-                        if workflow_background:
-                            # Queue the prompt
-                            background_response = wrk.queue_prompt(workflow_background)
-
-                            if background_response:
-                                prompt_id_background = background_response.get('prompt_id')
-                                if prompt_id_background:
-                                    st.info("Prompt queued. Waiting for image generation...")
-                                    
-                                    # Get the generated image
-                                    generated_image_background = wrk.get_image(prompt_id_background)
-                                    st.session_state.generated_image_background=generated_image_background
-                                else:
-                                    st.error("Failed to get prompt ID from the server response.")
-                        else:
-                            st.error("Failed to update the workflow. Please check your workflow file.")
+                wrk = Workflow(deterministic=deterministic)
+                with st.spinner("Processing..."):
+                    # Compiled template with a random seed, the prompt and the variant count
+                    workflow_background = wrk.build_asset_workflow("background", prompt_background, variants_background)
+
+                    if workflow_background:
+                        # Queue the prompt
+                        background_response = wrk.queue_prompt(workflow_background)
+
+                        if background_response:
+                            prompt_id_background = background_response.get('prompt_id')
+                            if prompt_id_background:
+                                st.info("Prompt queued. Waiting for image generation...")
+                                
+                                # Get the generated image
+                                st.session_state.pending_background = (wrk.server_for(prompt_id_background), prompt_id_background)
+                                st.button("Cancel generation", key="cancel_3")
+                                generated_images_background = wrk.get_images(prompt_id_background, on_event=progress_renderer())
+                                st.session_state.pending_background = None
+                                st.session_state.generated_image_background=[image_store.put(image) for image in generated_images_background]
+                            else:
+                                st.error("Failed to get prompt ID from the server response.")
+                    else:
+                        st.error("Failed to update the workflow. Please check your workflow file.")
         if st.session_state.generated_image_background:
-            st.image(st.session_state.generated_image_background, caption="Generated background")
+            show_stored_images(st.session_state.generated_image_background, "Generated background", "full_3")
 
 
 
@@ -405,35 +303,40 @@ with st.container():
 
     with col_bkg_1:
         st.header("Split background image")
+        split_variant = st.number_input(
+            "Variant to split:", min_value=1, max_value=max(len(st.session_state.generated_image_background), 1), value=1, key="split variant"
+        )
         if st.button("Splitting background", key="button 5"):
-            # Assuming 'image_path.png' is your image file
-            # Create a BytesIO object from the image bytes
-            img = st.session_state.generated_image_background
-            # Example of saving to BytesIO and then passing
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG') # Save the image to the buffer
-            buffer.seek(0) # Rewind the buffer to the beginning
-            split_image_into_tiles(buffer, "output_tiles", 1, 4)
-            img_bkg_s3_key=save_img_s3_file("background", "output_tiles")
-            dyna = DynamoAdapter(logger, TABLE_NAME)
-            dyna.save_chat_history_record(img_bkg_s3_key, prompt_background) 
-            st.session_state.bkg_img_1="output_tiles/tile_r0_c0.jpg"
-            st.session_state.bkg_img_2="output_tiles/tile_r0_c1.jpg"
-            st.session_state.bkg_img_3="output_tiles/tile_r0_c2.jpg"
-            st.session_state.bkg_img_4="output_tiles/tile_r0_c3.jpg"
+            img = image_store.image(st.session_state.generated_image_background[split_variant - 1])
+            if img is None:
+                st.error("This background is no longer in memory. Please generate it again.")
+            else:
+                # Tiles are cropped from the decoded image and kept in memory
+                tiles = split_image_into_tiles(img.pil, 1, 4)
+                upload_progress = st.progress(0.0, text="Uploading tiles...")
+                img_bkg_s3_key=save_img_s3_tiles(
+                    "background", tiles,
+                    progress_callback=lambda key, done, total: upload_progress.progress(done / total, text=f"Uploaded {done}/{total} tiles")
+                )
+                dyna = DynamoAdapter(logger, TABLE_NAME, buffered=True)
+                dyna.save_chat_history_record(img_bkg_s3_key, prompt_background) 
+                st.session_state.bkg_img_1=image_store.put(tiles[0][1], f"{img_bkg_s3_key}/{tiles[0][0]}")
+                st.session_state.bkg_img_2=image_store.put(tiles[1][1], f"{img_bkg_s3_key}/{tiles[1][0]}")
+                st.session_state.bkg_img_3=image_store.put(tiles[2][1], f"{img_bkg_s3_key}/{tiles[2][0]}")
+                st.session_state.bkg_img_4=image_store.put(tiles[3][1], f"{img_bkg_s3_key}/{tiles[3][0]}")
 
     with col_bkg_2:
         if st.session_state.bkg_img_1:
-            st.image(st.session_state.bkg_img_1, caption="Bkg 1")
+            show_stored_image(st.session_state.bkg_img_1, "Bkg 1")
     with col_bkg_3:
         if st.session_state.bkg_img_2:
-            st.image(st.session_state.bkg_img_2, caption="Bkg 2")
+            show_stored_image(st.session_state.bkg_img_2, "Bkg 2")
     with col_bkg_4:
         if st.session_state.bkg_img_3:
-            st.image(st.session_state.bkg_img_3, caption="Bkg 3")
+            show_stored_image(st.session_state.bkg_img_3, "Bkg 3")
     with col_bkg_5:
         if st.session_state.bkg_img_4:
-            st.image(st.session_state.bkg_img_4, caption="Bkg 4")
+            show_stored_image(st.session_state.bkg_img_4, "Bkg 4")
 
 with st.container():
 
@@ -442,15 +345,15 @@ with st.container():
 
     with col_bkg_shift_2:
         if st.session_state.bkg_img_3:
-            st.image(st.session_state.bkg_img_3, caption="Shift Bkg 3")
+            show_stored_image(st.session_state.bkg_img_3, "Shift Bkg 3")
     with col_bkg_shift_3:
         if st.session_state.bkg_img_4:
-            st.image(st.session_state.bkg_img_4, caption="Shift Bkg 4")
+            show_stored_image(st.session_state.bkg_img_4, "Shift Bkg 4")
     with col_bkg_shift_4:
         if st.session_state.bkg_img_1:
-            st.image(st.session_state.bkg_img_1, caption="Shift Bkg 1")
+            show_stored_image(st.session_state.bkg_img_1, "Shift Bkg 1")
     with col_bkg_shift_5:
         if st.session_state.bkg_img_2:
-            st.image(st.session_state.bkg_img_2, caption="Shift Bkg 2")
+            show_stored_image(st.session_state.bkg_img_2, "Shift Bkg 2")
 
 